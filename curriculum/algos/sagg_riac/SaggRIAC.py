@@ -9,17 +9,49 @@ import matplotlib.colorbar as cbar
 import matplotlib.patches as patches
 
 from curriculum.logging.visualization import save_image
+from curriculum.state.utils import ArrayBuffer
 from rllab.misc import logger
 
 
+def _normalize_bounds(bounds, num_states):
+    # Same as the bounds of slice(bound) for sequences of length num_states, elementwise.
+    bounds = np.where(bounds < 0, bounds + num_states, bounds)
+    return np.clip(bounds, 0, num_states)
+
+
+def _masked_interests(competences, masks, max_history):
+    """
+    Interest of the sub-sequences of competences selected by each row of masks, as computed by
+    Region.compute_interest on a region holding only those competences (in the same order).
+    :param competences: array of shape (n,)
+    :param masks: boolean array of shape (k, n)
+    :return: the number of selected competences and the interest of each row
+    """
+    competences = np.asarray(competences, dtype=float)
+    num_states = masks.sum(axis=1)
+    ranks = np.cumsum(masks, axis=1) - 1
+    half_history = int(max_history / 2)
+
+    def local_measure(start_index, end_index):
+        start_index = _normalize_bounds(start_index, num_states)[:, None]
+        end_index = _normalize_bounds(end_index, num_states)[:, None]
+        selected = masks & (ranks >= start_index) & (ranks < end_index)
+        return selected.dot(competences)
+
+    old_measure = local_measure(num_states - max_history, num_states - half_history)
+    new_measure = local_measure(num_states - half_history, num_states)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        interests = np.where(num_states > 0, np.abs(old_measure - new_measure) / np.maximum(num_states, 1), 0)
+    return num_states, interests
+
+
 class Region(object):
 
     def __init__(self, min_border, max_border, max_history=500, max_goals=500, num_random_splits=50, mode3_noise=0.1):
-        # self.states = collections.deque(maxlen=max_history)
-        # self.competences = collections.deque(maxlen=max_history)
-
-        self.states = []
-        self.competences = []
+        # The whole history of the region is kept (splits redistribute all of it), in growable arrays; the interest
+        # only reads a view of the last max_history competences.
+        self._states = ArrayBuffer()
+        self._competences = ArrayBuffer()
 
         self.min_border = min_border
         self.max_border = max_border
@@ -29,11 +61,25 @@ class Region(object):
         self.num_random_splits = num_random_splits
         self.mode3_noise = mode3_noise
 
+        # Set once the region is split: it becomes an inner node of the region tree.
+        self.children = None
+
+    @property
+    def states(self):
+        return self._states.data
+
+    @property
+    def competences(self):
+        return self._competences.data
+
     # Add this state and competence to the region.
     def add_state(self, state, competence):
-        self.states.append(state)
-        self.competences.append(competence)
-        self.num_goals += 1
+        self.add_states([state], [competence])
+
+    def add_states(self, states, competences):
+        self._states.extend(states)
+        self._competences.extend(competences)
+        self.num_goals += len(states)
 
     def is_too_big(self):
         # Split this region if it has too many goals, and if some of the goals have a positive competence!
@@ -56,45 +102,90 @@ class Region(object):
 
         return [region1, region2, success]
 
+    def set_children(self, region1, region2):
+        # Turn this region into an inner node of the region tree; its goals now live in region1 and region2.
+        self.children = [region1, region2]
+        self._states.clear()
+        self._competences.clear()
+
+    def find_leaf(self, state):
+        # Descend the region tree: states on a split boundary belong to the first subregion.
+        region = self
+        while region.children is not None:
+            region = region.children[0] if region.children[0].contains(state) else region.children[1]
+        return region
+
+    def route(self, states):
+        """
+        Batched find_leaf.
+        :param states: array of shape (n, state_size), all contained in this region
+        :return: list of (leaf, indices) pairs, with the indices of the states falling in each leaf in increasing order
+        """
+        groups = []
+        stack = [(self, np.arange(len(states)))]
+        while stack:
+            region, indices = stack.pop()
+            if len(indices) == 0:
+                continue
+            if region.children is None:
+                groups.append((region, indices))
+                continue
+            in_first = region.children[0].contains_n(states[indices])
+            stack.append((region.children[1], indices[~in_first]))
+            stack.append((region.children[0], indices[in_first]))
+        return groups
+
     def assign_states_to_regions(self, region1, region2):
         # Reassign all goals to one of these regions.
-        for state, competence in zip(self.states, self.competences):
-            if region1.contains(state):
-                region1.add_state(state, competence)
-            elif region2.contains(state):
-                region2.add_state(state, competence)
-            else:
-                logger.log("Region 1: " + str(region1.min_border) + " " + str(region1.max_border))
-                logger.log("Region 2: " + str(region2.min_border) + " " + str(region2.max_border))
-                raise Exception("Split region; now cannot find region for state: " + str(state))
+        states = self.states
+        if len(states) == 0:
+            return
+        in_region1 = region1.contains_n(states)
+        in_region2 = ~in_region1 & region2.contains_n(states)
+        lost = ~(in_region1 | in_region2)
+        if lost.any():
+            logger.log("Region 1: " + str(region1.min_border) + " " + str(region1.max_border))
+            logger.log("Region 2: " + str(region2.min_border) + " " + str(region2.max_border))
+            raise Exception("Split region; now cannot find region for state: " + str(states[np.argmax(lost)]))
+        region1.add_states(states[in_region1], self.competences[in_region1])
+        region2.add_states(states[in_region2], self.competences[in_region2])
 
     def optimal_split(self):
         # All split scores must be >= 0
         max_split_score = -1
-        max_region1 = None
-        max_region2 = None
+        max_split = None
 
         num_dim = len(self.min_border)
+        splits = []
         for i in range(self.num_random_splits):
             split_dim = random.randrange(num_dim)
             split_val = random.uniform(self.min_border[split_dim], self.max_border[split_dim])
-            region1, region2 = self.make_regions(split_dim, split_val)
-            self.assign_states_to_regions(region1, region2)
-            split_score = len(region1.states) * len(region2.states) * abs(region1.compute_interest() - region2.compute_interest())
-
-            if split_score > max_split_score:
-                max_region1 = region1
-                max_region2 = region2
-                max_split_score = split_score
-
-        if max_split_score == -1 or max_region1 is None:
+            splits.append((split_dim, split_val))
+
+        if splits:
+            # Score all the candidate splits at once: as all the states are in this region, a state falls in the first
+            # subregion of a split exactly when it is below the split value along the split dimension.
+            split_dims, split_vals = map(np.array, zip(*splits))
+            states = self.states.reshape(-1, num_dim)
+            competences = self.competences
+            in_region1 = (states[:, split_dims] <= split_vals).T
+            num_states1, interests1 = _masked_interests(competences, in_region1, self.max_history)
+            num_states2, interests2 = _masked_interests(competences, ~in_region1, self.max_history)
+            split_scores = num_states1 * num_states2 * np.abs(interests1 - interests2)
+
+            for split, split_score in zip(splits, split_scores):
+                if split_score > max_split_score:
+                    max_split = split
+                    max_split_score = split_score
+
+        if max_split_score == -1 or max_split is None:
             #TODO - what to do here?
             print("Problem - unable to find a good split!")
-            success = False
-        else:
-            success = True
+            return [None, None, False]
 
-        return [max_region1, max_region2, success]
+        region1, region2 = self.make_regions(*max_split)
+        self.assign_states_to_regions(region1, region2)
+        return [region1, region2, True]
 
     def make_regions(self, split_dim, split_val):
         # For now, just perform a single split.
@@ -126,11 +217,11 @@ class Region(object):
 
     # Compute the sum of the competences in a given range.
     def compute_local_measure(self, start_index, end_index):
-        return np.sum(np.array(self.competences)[start_index:end_index])
+        return np.sum(self.competences[start_index:end_index])
 
     # Compute the derivative of competences.
     def compute_interest(self):
-        num_states = len(self.states)
+        num_states = self.num_goals
 
         if num_states == 0:
             return 0
@@ -149,6 +240,9 @@ class Region(object):
         # Check whether this state is between the borders.
         return (np.less_equal(self.min_border, state).all() and np.less_equal(state, self.max_border).all())
 
+    def contains_n(self, states):
+        return np.all(np.less_equal(self.min_border, states) & np.less_equal(states, self.max_border), axis=-1)
+
     def sample_uniform(self):
         state = []
         for min_val, max_val in zip(self.min_border, self.max_border):
@@ -157,7 +251,7 @@ class Region(object):
 
     def sample_mode3(self):
         # Find the lowest competence goal in this region.
-        min_index, min_value = min(enumerate(self.competences), key=operator.itemgetter(1))
+        min_index = np.argmin(self.competences)
         bad_goal = np.copy(self.states[min_index])
 
         # Add noise to this goal.
@@ -190,7 +284,8 @@ class SaggRIAC(object):
         self.min_border = self.state_bounds[0]
         self.max_border = self.state_bounds[1]
 
-        # Create a region to represent the entire space.
+        # Create a region to represent the entire space. It is the root of the tree of splits, whose leaves are the
+        # current regions.
         self.whole_region = Region(self.min_border, self.max_border, max_history=max_history, max_goals=self.max_goals)
         self.regions.append(self.whole_region)
 
@@ -203,10 +298,10 @@ class SaggRIAC(object):
 
     # Find the region that contains a given state.
     def find_region(self, state):
-        for index, region in enumerate(self.regions):
-            if region.contains(state):
-                return [index, region]
-        raise Exception("Cannot find state: " + str(state) + " in any region!")
+        if not self.whole_region.contains(state):
+            raise Exception("Cannot find state: " + str(state) + " in any region!")
+        region = self.whole_region.find_leaf(state)
+        return [self.regions.index(region), region]
 
     def add_accidental_states(self, states, extend_dist_rew):
         # Treat these accidental states as if we reached them with the highest competence.
@@ -218,20 +313,48 @@ class SaggRIAC(object):
 
     # Add these states and competences to our list.
     def add_states(self, states, competences):
-        for state, competence in zip(states, competences):
-            # Find the appropriate region for this state.
-            index, region = self.find_region(state)
-            # Add this state to the region.
-            region.add_state(state, competence)
+        # The states are added in batches, one per split: each batch stops at the state that makes a region too big,
+        # and the remaining states are routed again once that region has been split.
+        if len(states) == 0:
+            return
+        states = np.asarray(states).reshape(len(states), -1)
+        competences = np.asarray(competences)
+
+        outside = np.flatnonzero(~self.whole_region.contains_n(states))
+        num_valid = outside[0] if len(outside) > 0 else len(states)
+
+        start = 0
+        while start < num_valid:
+            groups = self.whole_region.route(states[start:num_valid])
+            end = num_valid
+            full_region = None
+            for region, indices in groups:
+                room = max(region.max_goals - region.num_goals, 0)
+                if len(indices) > room and start + indices[room] < end:
+                    end = start + indices[room]
+                    full_region = region
+            if full_region is not None:
+                end += 1
+
+            for region, indices in groups:
+                indices = start + indices[indices < end - start]
+                if len(indices) > 0:
+                    region.add_states(states[indices], competences[indices])
 
             # If the region contains too many goals, split it into subregions.
-            if region.is_too_big():
-                [region1, region2, success] = region.split()
+            if full_region is not None and full_region.is_too_big():
+                [region1, region2, success] = full_region.split()
                 if success:
                     # Add the subregions and delete the original region.
+                    index = self.regions.index(full_region)
                     self.regions.append(region1)
                     self.regions.append(region2)
                     del self.regions[index]
+                    full_region.set_children(region1, region2)
+            start = end
+
+        if num_valid < len(states):
+            raise Exception("Cannot find state: " + str(states[num_valid]) + " in any region!")
 
     # Sample states from the regions.
     def sample_states(self, num_samples):
@@ -302,9 +425,7 @@ class SaggRIAC(object):
         return samples
 
     def compute_all_interests(self):
-        interests = np.array([])
-        for region in self.regions:
-            interests = np.append(interests, region.compute_interest())
+        interests = np.array([region.compute_interest() for region in self.regions], dtype=float)
 
         # Subtract the min interest
         min_interest = min(interests)
@@ -33,9 +33,9 @@ class Arm3dDiscEnv(MujocoEnv, Serializable):
     @overrides
     def get_current_obs(self):
         return np.concatenate([
-            self.model.data.qpos.flat, #[:self.model.nq // 2],
-            self.model.data.qvel.flat, #[:self.model.nq // 2],
-            self.model.data.site_xpos[0], # disc position
+            self.model.data.views.qpos.flat, #[:self.model.nq // 2],
+            self.model.data.views.qvel.flat, #[:self.model.nq // 2],
+            self.model.data.views.site_xpos[0], # disc position
         ])
 
     @contextmanager
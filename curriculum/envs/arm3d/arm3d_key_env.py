@@ -49,9 +49,9 @@ class Arm3dKeyEnv(MujocoEnv, Serializable):
 
     def get_current_obs(self):
         return np.concatenate([
-            self.model.data.qpos.flat,
-            self.model.data.qvel.flat,
-            self.model.data.site_xpos.flat,
+            self.model.data.views.qpos.flat,
+            self.model.data.views.qvel.flat,
+            self.model.data.views.site_xpos.flat,
         ]).reshape(-1)
 
     @contextmanager
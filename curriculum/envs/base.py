@@ -60,8 +60,70 @@ class UniformListStateGenerator(StateGenerator, Serializable):
         self.persist_count += 1
         return self.state
 
+class SumTree(object):
+    """
+    Binary tree over a list of non-negative weights, where every node holds the sum of its two children. Changing k
+    weights costs O(k log N) and drawing an index with probability proportional to its weight costs O(log N). Only the
+    weights are pickled.
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        self.size = len(weights)
+        self.capacity = 1
+        while self.capacity < self.size:
+            self.capacity *= 2
+        self.tree = np.zeros(2 * self.capacity)
+        self.tree[self.capacity:self.capacity + self.size] = weights
+        level = self.capacity
+        while level > 1:
+            self.tree[level // 2:level] = self.tree[level:2 * level:2] + self.tree[level + 1:2 * level:2]
+            level //= 2
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    @property
+    def weights(self):
+        return self.tree[self.capacity:self.capacity + self.size]
+
+    def update(self, indices, weights):
+        nodes = np.asarray(indices, dtype=int) + self.capacity
+        self.tree[nodes] = weights
+        nodes = np.unique(nodes // 2)
+        while len(nodes) and nodes[0] > 0:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, value):
+        """ Index i such that the weights before i sum to at most value, and those up to i to more than value. """
+        node = 1
+        while node < self.capacity:
+            left = 2 * node
+            # the right branch is skipped if empty, in case rounding pushed value beyond the total
+            if value < self.tree[left] or self.tree[left + 1] <= 0:
+                node = left
+            else:
+                value -= self.tree[left]
+                node = left + 1
+        return node - self.capacity
+
+    def sample(self):
+        return self.find(np.random.uniform(0, self.total))
+
+    def copy(self):
+        return SumTree(self.weights)
+
+    def __getstate__(self):
+        return dict(weights=np.array(self.weights))
+
+    def __setstate__(self, d):
+        self.__init__(d['weights'])
+
+
 class ListStateGenerator(StateGenerator, Serializable):
-    """ Generating goals uniformly from a goal list. """
+    """ Generating goals from a goal list, with the given (possibly unnormalized) distribution, or a SumTree. """
 
     def __init__(self, state_list, dist = None, persistence=1):
         Serializable.quick_init(self, locals())
@@ -70,18 +132,23 @@ class ListStateGenerator(StateGenerator, Serializable):
         self.state_size = np.size(self.state_list[0])  # assumes all goals have same dim as first in list
         self.persistence = persistence
         self.persist_count = 0
-        assert(len(dist) == len(state_list))
-        # assert(np.sum(dist) == 1)
-        self.dist = dist
+        if dist is None:
+            dist = np.ones(self.num_states)
+        # each reset draws from a sum tree in O(log N), instead of np.random.choice(p=dist) in O(N)
+        self._sum_tree = dist.copy() if isinstance(dist, SumTree) else SumTree(dist)
+        assert(self._sum_tree.size == len(state_list))
+        assert(self._sum_tree.total > 0)
         self.unused_states = [state for state in state_list]
         random.seed()
         super(ListStateGenerator, self).__init__()
 
-        #TODO: write something that just updates probabilities?
+    @property
+    def dist(self):
+        return self._sum_tree.weights / self._sum_tree.total
 
     def update(self, *args, **kwargs):
         if self.persist_count % self.persistence == 0:
-            self._state = self.state_list[np.random.choice(np.arange(self.num_states), p = self.dist)]
+            self._state = self.state_list[self._sum_tree.sample()]
             self.persist_count = 0
         self.persist_count += 1
         return self.state
@@ -127,6 +127,18 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         else:
             return True
 
+    def is_feasible_n(self, goals):
+        """ Batched is_feasible: boolean mask over goals """
+        obj = self.wrapped_env
+        while not hasattr(obj, 'is_feasible') and hasattr(obj, 'wrapped_env'):
+            obj = obj.wrapped_env
+        if hasattr(obj, 'is_feasible_n'):
+            return obj.is_feasible_n(np.array(goals))
+        elif hasattr(obj, 'is_feasible'):
+            return np.array([obj.is_feasible(np.array(goal)) for goal in goals], dtype=bool)
+        else:
+            return np.ones(len(goals), dtype=bool)
+
     def reset(self, reset_goal=True, **kwargs):  # allows to pass init_state if needed
         if reset_goal:
             self.update_goal()
@@ -237,6 +249,13 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         ub = BIG * np.ones(shp)
         return spaces.Box(ub * -1, ub)
 
+    @overrides
+    def vectorize(self, n_envs):
+        if type(self) is not GoalExplorationEnv:
+            # subclasses (e.g. GoalStartExplorationEnv) override reset, step or the observations, which the batch ignores
+            raise NotImplementedError
+        return GoalExplorationEnvBatch(self, self.wrapped_env.vectorize(n_envs))
+
     @overrides
     def log_diagnostics(self, paths, n_traj=1, *args, **kwargs):
         # Process by time steps
@@ -281,6 +300,106 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         logger.record_tabular('FeasibilityRate', np.mean(feasible))
 
 
+class GoalExplorationEnvBatch(object):
+    """
+    Batched version of a GoalExplorationEnv: every copy of the wrapped env gets its own goal, sampled from the goal
+    generator of the env at reset, and the distances, rewards and observations of all the stepped copies are computed
+    with array operations. The goal generator stays the one of the env, so updating it also updates the batch.
+    """
+
+    def __init__(self, env, wrapped_batch):
+        """
+        :param env: the GoalExplorationEnv to copy
+        :param wrapped_batch: batched version of its wrapped env
+        """
+        self.env = env
+        self.wrapped_batch = wrapped_batch
+        self.n_envs = wrapped_batch.n_envs
+        self.goals = None
+        self.goals_feasible = np.ones(self.n_envs, dtype=bool)
+
+    def reset(self, indices, reset_goal=True, **kwargs):
+        """
+        :param indices: copies to reset
+        :param reset_goal: sample a new goal for each of them
+        :return: array with the observations of the reset copies
+        """
+        if 'init_state' in kwargs:
+            # GoalExplorationEnv.reset may move the goal according to the init_state, which is not done here
+            raise NotImplementedError("Resetting to an init_state is not supported by the batched env")
+        env = self.env
+        indices = np.arange(self.n_envs)[indices]
+        if reset_goal or self.goals is None:
+            goals = []
+            for _ in indices:
+                env.update_goal()
+                goals.append(np.array(env.current_goal))
+            if self.goals is None:
+                self.goals = np.zeros((self.n_envs,) + goals[0].shape)
+            self.goals[indices] = goals
+            if env.only_feasible:
+                self.goals_feasible[indices] = env.is_feasible_n(self.goals[indices])
+        obs = self.wrapped_batch.reset(indices, goal=self.goals[indices], **kwargs)
+        if env.append_goal_to_observation:
+            obs = self.append_goal_observation(obs, indices)
+        return obs
+
+    def step(self, actions, indices=None):
+        """
+        :param actions: array with the action of every stepped copy
+        :param indices: copies to step, all of them by default
+        """
+        env = self.env
+        indices = np.arange(self.n_envs)[indices if indices is not None else slice(None)]
+        observations, rewards, dones, infos = self.wrapped_batch.step(actions, indices)
+        infos['reward_inner'] = reward_inner = env.inner_weight * rewards
+        if 'distance' not in infos:
+            infos['distance'] = dist = self.dist_to_goal(observations, indices)
+            infos['reward_dist'] = reward_dist = - env.extend_dist_rew_weight * dist
+            goal_reached = dist < env.terminal_eps
+            if env.only_feasible:
+                goal_reached &= self.goals_feasible[indices]
+        else:
+            dist = infos['distance']
+            goal_reached = dist < env.terminal_eps
+            infos['reward_dist'] = reward_dist = - env.extend_dist_rew_weight * dist
+        infos['goal_reached'] = 1.0 * goal_reached
+        infos['goal'] = self.goals[indices]
+
+        if env.terminate_env:
+            dones = dones | goal_reached
+        if env.append_goal_to_observation:
+            observations = self.append_goal_observation(observations, indices)
+        return (
+            observations,
+            reward_dist + reward_inner + infos['goal_reached'] * env.goal_weight,
+            dones,
+            infos
+        )
+
+    def transform_to_goal_space(self, observations):
+        return np.array([self.env.transform_to_goal_space(obs) for obs in observations])
+
+    def dist_to_goal(self, observations, indices):
+        goal_obs = self.transform_to_goal_space(observations)
+        goals = self.goals[indices]
+        if self.env.distance_metric == 'L1':
+            return np.linalg.norm(goal_obs - goals, ord=1, axis=1)
+        elif self.env.distance_metric == 'L2':
+            return np.linalg.norm(goal_obs - goals, ord=2, axis=1)
+        elif callable(self.env.distance_metric):
+            return np.array([self.env.distance_metric(g_obs, goal) for g_obs, goal in zip(goal_obs, goals)])
+        else:
+            raise NotImplementedError('Unsupported distance metric type.')
+
+    def append_goal_observation(self, observations, indices):
+        if self.env.append_transformed_obs:
+            return np.concatenate(
+                [observations, self.transform_to_goal_space(observations), self.goals[indices]], axis=1
+            )
+        return np.concatenate([observations, self.goals[indices]], axis=1)
+
+
 def get_goal_observation(env):
     if hasattr(env, 'goal_observation'):
         return env.goal_observation  # should be unnecessary
@@ -73,6 +73,11 @@ class GoalStartExplorationEnv(StartEnv, GoalExplorationEnv, Serializable):
         goal_obs = GoalExplorationEnv.get_current_obs(self)
         return StartEnv.append_start_observation(self, goal_obs)
 
+    @overrides
+    def vectorize(self, n_envs):
+        # the batched GoalExplorationEnv ignores the start generator and the appended start observation
+        raise NotImplementedError
+
     @overrides
     def transform_to_start_space(self, obs, *args, **kwargs):
         obj = self.wrapped_env
@@ -17,8 +17,8 @@ class AntEnv(MujocoEnv, Serializable):
 
     def get_current_obs(self):
         return np.concatenate([
-            self.model.data.qpos.flat,
-            self.model.data.qvel.flat,
+            self.model.data.views.qpos.flat,
+            self.model.data.views.qvel.flat,
             # np.clip(self.model.data.cfrc_ext, -1, 1).flat, # this is 84 dimensions!!
             self.get_body_xmat("torso").flat,
             self.get_body_com("torso"),
@@ -16,12 +16,12 @@ class AntEnv(MujocoEnv, Serializable):
         Serializable.__init__(self, *args, **kwargs)
 
     def get_current_obs(self):
-        pos = self.model.data.qpos.flat[:-2]
-        vel = self.model.data.qvel.flat[:-2]
-        current_goal = self.model.data.qpos.flat[-2:].reshape(-1)
+        pos = self.model.data.views.qpos.flat[:-2]
+        vel = self.model.data.views.qvel.flat[:-2]
+        current_goal = self.model.data.views.qpos.flat[-2:].reshape(-1)
         non_goal_obs = np.concatenate([
             pos, vel,
-            np.clip(self.model.data.cfrc_ext, -1, 1).flat,
+            np.clip(self.model.data.views.cfrc_ext, -1, 1).flat,
             self.get_body_xmat("torso").flat,
             self.get_body_com("torso"),
         ]).reshape(-1)
@@ -10,7 +10,8 @@ from rllab.envs.proxy_env import ProxyEnv
 # from rllab.envs.mujoco.maze.maze_env_utils import construct_maze
 from curriculum.envs.maze.maze_env_utils import construct_maze
 from rllab.envs.mujoco.mujoco_env import MODEL_DIR, BIG
-from rllab.envs.mujoco.maze.maze_env_utils import ray_segment_intersect, point_distance
+from rllab.envs.mujoco.maze.maze_env_utils import construct_segments, sensor_readings, construct_occupancy, \
+    in_cells
 from rllab.core.serializable import Serializable
 from rllab.misc.overrides import overrides
 
@@ -124,6 +125,8 @@ class MazeEnv(ProxyEnv, Serializable):
 
         self._goal_range = self._find_goal_range()
         self._cached_segments = None
+        self._cached_occupancy = None
+        self._cached_empty_space = None
 
         inner_env = model_cls(file_path=file_path, *args, **kwargs)  # file to the robot specifications
         ProxyEnv.__init__(self, inner_env)  # here is where the robot env will be initialized
@@ -134,6 +137,27 @@ class MazeEnv(ProxyEnv, Serializable):
     #     self.wrapped_env.update_goal_generator(goal_generator)
     #     self._goal_generator = goal_generator
 
+    def get_current_maze_obs(self):
+        # readings of the wall and goal sensors around the robot. They are not part of get_current_obs
+        robot_x, robot_y = self.wrapped_env.get_body_com("torso")[:2]
+        ori = self.get_ori()
+        segments, is_goal = self._get_segments()
+        ray_oris = ori - self._sensor_span * 0.5 + \
+            (2 * np.arange(self._n_bins) + 1) / (2 * self._n_bins) * self._sensor_span
+        wall_readings, goal_readings = sensor_readings((robot_x, robot_y), ray_oris, segments, is_goal,
+                                                       self._sensor_range)
+        return np.concatenate([
+            wall_readings,
+            goal_readings
+        ])
+
+    def _get_segments(self):
+        # the maze is fixed after __init__, so its segments are only computed once
+        if self._cached_segments is None:
+            self._cached_segments = construct_segments(self.MAZE_STRUCTURE, self.MAZE_SIZE_SCALING,
+                                                       self._init_torso_x, self._init_torso_y)
+        return self._cached_segments
+
     def get_current_robot_obs(self):
         return self.wrapped_env.get_current_obs()
 
@@ -202,39 +226,45 @@ class MazeEnv(ProxyEnv, Serializable):
                     maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
                     return minx, maxx, miny, maxy
 
+    def _get_occupancy(self):
+        # boolean grids of the walls and of the empty cells of the maze, computed once
+        if self._cached_occupancy is None:
+            self._cached_occupancy = construct_occupancy(self.MAZE_STRUCTURE)
+        return self._cached_occupancy
+
     def _is_in_collision(self, pos):
-        x, y = pos
-        structure = self.MAZE_STRUCTURE
-        size_scaling = self.MAZE_SIZE_SCALING
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 1:
-                    minx = j * size_scaling - size_scaling * 0.5 - self._init_torso_x
-                    maxx = j * size_scaling + size_scaling * 0.5 - self._init_torso_x
-                    miny = i * size_scaling - size_scaling * 0.5 - self._init_torso_y
-                    maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
-                    if minx <= x <= maxx and miny <= y <= maxy:
-                        return True
-        return False
+        return bool(self.is_in_collision_n(np.reshape(pos, (1, 2)))[0])
+
+    def is_in_collision_n(self, points):
+        """ For each x, y point, whether it is inside (or on the boundary of) a wall block """
+        walls, _ = self._get_occupancy()
+        return in_cells(points, walls, self.MAZE_SIZE_SCALING, self._init_torso_x, self._init_torso_y, closed=True)
 
     def find_empty_space(self):
-        structure = self.MAZE_STRUCTURE
-        size_scaling = self.MAZE_SIZE_SCALING
-        empty_space = []
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 'r' or structure[i][j] == 'g' or structure[i][j] == 0:
-                    empty_space.append((j * size_scaling - self._init_torso_x, i * size_scaling - self._init_torso_y))
-                    #return j * size_scaling, i * size_scaling
-        return empty_space
+        if self._cached_empty_space is None:
+            structure = self.MAZE_STRUCTURE
+            size_scaling = self.MAZE_SIZE_SCALING
+            empty_space = []
+            for i in range(len(structure)):
+                for j in range(len(structure[0])):
+                    if structure[i][j] == 'r' or structure[i][j] == 'g' or structure[i][j] == 0:
+                        empty_space.append((j * size_scaling - self._init_torso_x,
+                                            i * size_scaling - self._init_torso_y))
+            self._cached_empty_space = empty_space
+        return list(self._cached_empty_space)
 
     def is_feasible(self, pos):  # the arg is the goal, not the full space!!!
-        empty_space = self.find_empty_space()
-        for space in empty_space:
-            if np.size(np.where(np.abs(np.array(np.array(pos).reshape(-1)[:2])-np.array(space)) < self.MAZE_SIZE_SCALING/2)[0]) == 2:
-                # print("Pos {} is in empty space: {}".format(pos, space))
-                return True
-        return False
+        return bool(self.is_feasible_n(np.array(pos).reshape(1, -1))[0])
+
+    def is_feasible_n(self, points):
+        """
+        Batched is_feasible: for each point (of which only the first two coordinates are used), whether it lies in the
+        interior of an empty cell of the maze
+        """
+        points = np.asarray(points)
+        points = points.reshape(len(points), -1)[:, :2]
+        _, empty = self._get_occupancy()
+        return in_cells(points, empty, self.MAZE_SIZE_SCALING, self._init_torso_x, self._init_torso_y, closed=False)
 
     @overrides
     def reset(self, *args, **kwargs):
@@ -62,13 +62,8 @@ def sample_unif_feas(train_env, samples_per_cell):
 
     size_scaling = maze_env.MAZE_SIZE_SCALING
 
-    states = []
-    for empty_space in empty_spaces:
-        for i in range(samples_per_cell):
-            state = np.array(empty_space) + np.random.uniform(-size_scaling/2, size_scaling/2, 2)
-            states.append(state)
-
-    return np.array(states)
+    centers = np.repeat(np.array(empty_spaces, dtype=float).reshape(-1, 2), samples_per_cell, axis=0)
+    return centers + np.random.uniform(-size_scaling/2, size_scaling/2, centers.shape)
 
 
 def my_square_scatter(axes, x_array, y_array, z_array, min_z=None, max_z=None, size=0.5, **kwargs):
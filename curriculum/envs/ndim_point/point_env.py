@@ -86,3 +86,66 @@ class PointEnv(Env, Serializable):
         self.pos = np.clip(pos, -self.state_ub[:self.dim], self.state_ub[:self.dim])
         self.vel = np.clip(vel, -self.state_ub[-self.dim:], self.state_ub[-self.dim:])
 
+    @overrides
+    def vectorize(self, n_envs):
+        if self.control_mode != 'linear':
+            raise NotImplementedError("Control mode not supported!")
+        return PointEnvBatch(self, n_envs)
+
+
+class PointEnvBatch(object):
+    """
+    n_envs copies of a PointEnv, with the positions and velocities stored as (n_envs, dim) arrays and all the copies
+    stepped with the same array operations as PointEnv.step.
+    """
+
+    def __init__(self, env, n_envs):
+        """
+        :param env: the PointEnv to copy
+        :param n_envs: number of copies
+        """
+        self.n_envs = n_envs
+        self.dim = env.dim
+        self.dt = env.dt
+        self.state_ub = env.state_ub
+        self.pos = np.zeros((n_envs, self.dim))
+        self.vel = np.zeros((n_envs, self.dim))
+
+    def reset(self, indices, pos=None, vel=None, **kwargs):
+        """
+        :param indices: copies to reset
+        :param pos: positions to reset them to, one per copy (or shared), zero by default
+        :param vel: velocities to reset them to, one per copy (or shared), zero by default
+        :return: (len(indices), 2 * dim) array of observations
+        """
+        pos_ub, vel_ub = self.state_ub[:self.dim], self.state_ub[-self.dim:]
+        self.pos[indices] = 0 if pos is None else np.clip(pos, -pos_ub, pos_ub)
+        self.vel[indices] = 0 if vel is None else np.clip(vel, -vel_ub, vel_ub)
+        return self.get_current_obs(indices)
+
+    def step(self, actions, indices=None):
+        """
+        :param actions: (len(indices), dim) array with the acceleration of every stepped copy
+        :param indices: copies to step, all of them by default
+        """
+        if indices is None:
+            indices = slice(None)
+        pos_ub, vel_ub = self.state_ub[:self.dim], self.state_ub[-self.dim:]
+        vel = np.clip(self.vel[indices] + actions * self.dt, -vel_ub, vel_ub)
+        pos = np.clip(self.pos[indices] + vel * self.dt, -pos_ub, pos_ub)
+        self.vel[indices] = vel
+        self.pos[indices] = pos
+
+        reward_ctrl = - np.square(actions).sum(axis=1)
+        return (
+            np.concatenate([pos, vel], axis=1),
+            reward_ctrl,
+            np.zeros(len(reward_ctrl), dtype=bool),
+            dict(reward_ctrl=reward_ctrl),
+        )
+
+    def get_current_obs(self, indices=None):
+        if indices is None:
+            indices = slice(None)
+        return np.concatenate([self.pos[indices], self.vel[indices]], axis=1)
+
@@ -39,7 +39,9 @@ from curriculum.experiments.asym_selfplay.envs.alice_env import AliceEnv
 from curriculum.state.evaluator import parallel_map, FunctionWrapper
 from curriculum.state.utils import StateCollection
 from curriculum.logging.visualization import plot_labeled_states, plot_labeled_samples
-from curriculum.state.evaluator import FunctionWrapper, parallel_map
+from curriculum.state.evaluator import FunctionWrapper, parallel_map, _split_in_chunks
+from rllab.sampler import parallel_sampler
+from rllab.sampler.parallel_sampler import _get_scoped_G
 from rllab.sampler.stateful_pool import singleton_pool
 
 
@@ -204,6 +206,15 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
     print("the starts from where we generate more is of len: ", len(starts))
     if horizon <= 1:
         states = starts  # you better give me some starts if there is no horizon!
+    elif not animated:
+        env.reset(init_state=starts[0])
+        states, num_roll_reached_goal, num_roll = stream_brownian_starts(
+            env, starts, env.start_observation, size=size, horizon=horizon, variance=variance, policy=policy,
+            subsample=subsample,
+        )
+        logger.log("Generating starts, rollouts that reached goal: " + str(num_roll_reached_goal) + " out of " + str(num_roll))
+        logger.log("Starts generated.")
+        return states
     else:
         n_starts = len(starts)
         i = 0
@@ -217,62 +228,33 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
         # if animated:
         #     env.render()
         while len(states) < size:
-            if animated:
-                steps += 1
-                if done or steps >= horizon:
-                    i += 1
-                    steps = 0
-                    done = False
-                    obs = env.reset(init_state=starts[i % n_starts])
-                    # import pdb; pdb.set_trace()
-                    states.append(env.start_observation)
-                    num_roll += 1
-                    if goal_reached:
-                        num_roll_reached_goal += 1
-                else:
-                    noise = np.random.uniform(*env.action_space.bounds)
-                    if policy:
-                        action, _ = policy.get_action(obs)
-                    else:
-                        action = noise
-                    if zero_action:
-                        action = np.zeros_like(action)
-                    obs, _, done, env_info = env.step(action)
-                    states.append(env.start_observation)
-                    if done and env_info['goal_reached']:  # we don't care about goal done, otherwise will never advance!
-                        goal_reached = True
-                        done = False
-                # env.render()
-                # timestep = 0.05
-                # time.sleep(timestep / speedup)
-            else:
+            steps += 1
+            if done or steps >= horizon:
+                i += 1
+                steps = 0
+                done = False
+                obs = env.reset(init_state=starts[i % n_starts])
                 # import pdb; pdb.set_trace()
-                brownian_state_wrapper = FunctionWrapper(
-                    brownian,
-                    env=env,
-                    kill_outside=env.kill_outside,
-                    kill_radius=env.kill_radius,  # this should be set before passing the env to generate_starts
-                    horizon=horizon,
-                    variance=variance,
-                    policy=policy,
-                )
-                parallel_starts = [starts[j % n_starts] for j in range(i,i+singleton_pool.n_parallel)]
-                # print("parallel sampling from :", parallel_starts)
-                i += singleton_pool.n_parallel
-                results = parallel_map(brownian_state_wrapper, parallel_starts)
-                new_states = np.concatenate([result[0] for result in results])
-
-                # show where these states are:
-                np.random.shuffle(new_states)  # todo: this has a prety big impoact!! Why?? (related to collection)
-                # generate_starts(env, starts=new_states, horizon=10, variance=0,
-                #                 zero_action=True, animated=True, speedup=10, size=100)
-
-                print('Just collected {} rollouts, with {} states'.format(len(results), new_states.shape))
-                states.extend(new_states.tolist())
-                print('now the states are of len: ', len(states))
-                num_roll_reached_goal += np.sum([result[1] for result in results])
-                print("num_roll_reached_goal ",  np.sum([result[1] for result in results]))
-                num_roll += len(results)
+                states.append(env.start_observation)
+                num_roll += 1
+                if goal_reached:
+                    num_roll_reached_goal += 1
+            else:
+                noise = np.random.uniform(*env.action_space.bounds)
+                if policy:
+                    action, _ = policy.get_action(obs)
+                else:
+                    action = noise
+                if zero_action:
+                    action = np.zeros_like(action)
+                obs, _, done, env_info = env.step(action)
+                states.append(env.start_observation)
+                if done and env_info['goal_reached']:  # we don't care about goal done, otherwise will never advance!
+                    goal_reached = True
+                    done = False
+            # env.render()
+            # timestep = 0.05
+            # time.sleep(timestep / speedup)
         logger.log("Generating starts, rollouts that reached goal: " + str(num_roll_reached_goal) + " out of " + str(num_roll))
     logger.log("Starts generated.")
     if subsample is None:
@@ -283,20 +265,158 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
             return states
         return states[np.random.choice(np.shape(states)[0], size=subsample)]
 
+
+# scope under which the env (and policy) doing the brownian rollouts of generate_starts is kept resident in the
+# singleton_pool workers
+BROWNIAN_SCOPE = 'brownian_starts'
+
+
+def stream_brownian_starts(env, starts, first_state, size, horizon, variance=1, policy=None, subsample=None):
+    """
+    Run brownian rollouts from the given starts (taken in turn) on the singleton_pool workers until exactly size
+    states are generated, counting first_state. The env (and policy) are only shipped to the workers the first time,
+    staying resident under BROWNIAN_SCOPE. Each round dispatches about the number of rollouts still needed, given the
+    mean rollout length so far (and never more than the states still needed, as every rollout gives at least one), and
+    the results are consumed as they arrive: the states of every rollout are shuffled, and the last rollout is cut as
+    soon as size is reached. The rollouts of the round still running at that point are waited for, so that none is
+    left in the pool.
+    :param subsample: if given and not bigger than size, only subsample states drawn with replacement from the
+    generated ones are returned; they are picked as they arrive, so the other states are never stored
+    :return: array of states, number of rollouts that reached the goal, number of rollouts
+    """
+    parallel_sampler.populate_task(env, policy, scope=BROWNIAN_SCOPE)
+    policy_params = policy.get_param_values() if policy is not None else None
+    first_state = np.array(first_state)
+    n_starts = len(starts)
+
+    if subsample is not None and subsample <= size:
+        # position in the stream of each of the subsampled states
+        picks = np.random.choice(size, size=subsample)
+        pick_order = np.argsort(picks, kind='mergesort')
+        sorted_picks = picks[pick_order]
+        states = np.empty((subsample,) + first_state.shape, dtype=first_state.dtype)
+    else:
+        picks = None
+        states = np.empty((size,) + first_state.shape, dtype=first_state.dtype)
+
+    def write(block, position):
+        if picks is None:
+            states[position:position + len(block)] = block
+        else:
+            lo, hi = np.searchsorted(sorted_picks, [position, position + len(block)])
+            states[pick_order[lo:hi]] = block[sorted_picks[lo:hi] - position]
+
+    write(first_state[None], 0)
+    n_states = 1
+    i = 0
+    num_roll = 0
+    num_roll_reached_goal = 0
+    num_rollout_states = 0
+    while n_states < size:
+        mean_length = num_rollout_states / num_roll if num_roll > 0 else horizon + 1
+        n_rollouts = min(size - n_states, max(singleton_pool.n_parallel, int(np.ceil((size - n_states) / mean_length))))
+        args_list = [(starts[j % n_starts], env.kill_outside, env.kill_radius, horizon, variance, policy_params,
+                      BROWNIAN_SCOPE) for j in range(i, i + n_rollouts)]
+        i += n_rollouts
+
+        round_start = time.time()
+        round_roll = 0
+        round_reached_goal = 0
+        round_states = n_states
+        results = singleton_pool.run_imap_unordered(_worker_brownian, args_list)
+        for rollout_states, goal_reached in results:
+            round_roll += 1
+            round_reached_goal += goal_reached
+            num_rollout_states += len(rollout_states)
+            np.random.shuffle(rollout_states)  # todo: this has a prety big impoact!! Why?? (related to collection)
+            block = rollout_states[:size - n_states]
+            write(block, n_states)
+            n_states += len(block)
+            if n_states >= size:
+                break
+        if singleton_pool.n_parallel > 1:
+            # drain the rollouts already dispatched, otherwise they would keep the workers busy for the next jobs
+            for _ in results:
+                pass
+        num_roll += round_roll
+        num_roll_reached_goal += round_reached_goal
+        elapsed = time.time() - round_start
+        logger.log("Brownian round: {} rollouts ({} reached the goal), {} states in {:.2f}s ({:.1f} states/s), "
+                   "{}/{} states".format(round_roll, round_reached_goal, n_states - round_states, elapsed,
+                                         (n_states - round_states) / max(elapsed, 1e-8), n_states, size))
+    return states, num_roll_reached_goal, num_roll
+
+
+def _worker_brownian(G, start, kill_outside, kill_radius, horizon, variance, policy_params, scope):
+    G = _get_scoped_G(G, scope)
+    if G.policy is not None:
+        G.policy.set_param_values(policy_params)
+    states, goal_reached = brownian(start, G.env, kill_outside, kill_radius, horizon, variance, policy=G.policy)
+    return np.array(states), goal_reached
+
+# scope under which the env used to check feasibility is kept resident in the singleton_pool workers
+FEASIBILITY_SCOPE = 'feasibility_checker'
+
+
 def parallel_check_feasibility(starts, env, max_path_length=50, n_processes=-1):
-    feasibility_wrapper = FunctionWrapper(
-        check_feasibility,
-        env =env,
-        max_path_length=max_path_length,
-    )
-    is_feasible = parallel_map(
-        feasibility_wrapper,
-        starts,
-        n_processes,
-    )
-    #TODO: is there better way to do this?
-    result = [starts[i] for i in range(len(starts)) if is_feasible[i]] # keep starts that are feasible only
-    return np.array(result)
+    """ Keep only the feasible starts (see check_feasibility) """
+    starts = np.asarray(starts)
+    return starts[feasibility_mask(starts, env, max_path_length=max_path_length, n_processes=n_processes)]
+
+
+def feasibility_mask(starts, env, max_path_length=50, n_processes=-1):
+    """
+    Check the feasibility of all the starts, sending them to the workers in chunks. With n_processes=-1 the
+    singleton_pool workers are used, and env is only shipped to them the first time (or when a different env is
+    given), staying resident under FEASIBILITY_SCOPE.
+    :return: boolean mask over starts, True for the feasible ones
+    """
+    starts = np.asarray(starts)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=bool)
+    start_time = time.time()
+    if n_processes == -1:
+        parallel_sampler.populate_task(env, None, scope=FEASIBILITY_SCOPE)
+        chunks = _split_in_chunks(starts, 4 * singleton_pool.n_parallel)
+        masks = singleton_pool.run_map(
+            _worker_check_feasibility,
+            [(chunk, max_path_length, FEASIBILITY_SCOPE) for chunk in chunks]
+        )
+    else:
+        feasibility_wrapper = FunctionWrapper(
+            check_feasibility_batch,
+            env=env,
+            max_path_length=max_path_length,
+        )
+        masks = parallel_map(feasibility_wrapper, _split_in_chunks(starts, 4 * n_processes), n_processes)
+    mask = np.concatenate(masks)
+    elapsed = time.time() - start_time
+    logger.log("Checked feasibility of {} starts in {:.2f}s ({:.1f} starts/s), {} feasible".format(
+        len(starts), elapsed, len(starts) / max(elapsed, 1e-8), np.sum(mask)))
+    return mask
+
+
+def _worker_check_feasibility(G, starts, max_path_length, scope):
+    G = _get_scoped_G(G, scope)
+    return check_feasibility_batch(starts, G.env, max_path_length)
+
+
+def check_feasibility_batch(starts, env, max_path_length=50):
+    """
+    Same as check_feasibility for each start, reusing env and the zero action across all of them
+    :return: boolean mask over starts, True for the feasible ones
+    """
+    a = np.zeros(env.action_space.flat_dim)
+    mask = np.ones(len(starts), dtype=bool)
+    for i, start in enumerate(starts):
+        env.reset(start)
+        for _ in range(max_path_length):
+            d = env.step(a)[2]
+            if d:
+                mask[i] = False
+                break
+    return mask
+
 
 def check_feasibility(start, env, max_path_length = 50):
     """
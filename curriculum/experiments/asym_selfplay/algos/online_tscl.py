@@ -1,5 +1,7 @@
 import numpy as np
 
+from curriculum.envs.base import ListStateGenerator, SumTree
+
 class Online_TCSL:
 
     #TODO: Implement absolute value version
@@ -13,6 +15,17 @@ class Online_TCSL:
         self.boltzmann = boltzmann
         if self.boltzmann:
             self.temperature = 0.0004
+        # Unnormalized sampling weights of the starts, only updated where the Q values (or the greedy start) change.
+        self.greedy_index = np.argmax(self.q_vals)
+        self.weights = SumTree(self._compute_weights(np.arange(self.num_starts)))
+
+    def _compute_weights(self, indices):
+        if not self.boltzmann:
+            weights = np.ones(len(indices)) * (self.eps / self.num_starts)
+            weights[indices == self.greedy_index] += (1 - self.eps)
+            return weights
+        else:
+            return np.exp(self.q_vals[indices] / self.temperature)
 
     def get_distribution(self, boltzmann = False):
         # If first step, return a uniform distribution
@@ -20,15 +33,12 @@ class Online_TCSL:
             dist = np.ones(self.num_starts) / self.num_starts
             return dist
 
-        if not self.boltzmann:
-            dist = np.ones(self.num_starts) * (self.eps / self.num_starts) # can cache to not compute everytime
-            dist[np.argmax(self.q_vals)] += (1 - self.eps)
-            dist = np.array(dist)
-            assert (abs(np.sum(dist) - 1) < 0.02)
-            return dist / (np.sum(dist))
-        else:
-            dist = np.exp(self.q_vals / 0.0004)
-            return dist / (np.sum(dist))
+        dist = self.weights.weights
+        return dist / self.weights.total
+
+    def get_state_generator(self, persistence=1):
+        # Sampling the starts from a copy of the weights, which is pickled compactly to the workers.
+        return ListStateGenerator(self.starts, self.weights.copy(), persistence=persistence)
 
     def get_q(self):
         return self.q_vals
@@ -40,7 +50,13 @@ class Online_TCSL:
         improvement = rewards - self.reward_prev
         new_q_vals = self.alpha * improvement + (1 - self.alpha) * self.q_vals
         # a bit of a hack to only update q_vals if we have enough trajectories
-        self.q_vals = updated * new_q_vals + (1 - updated) * self.q_vals
+        new_q_vals = updated * new_q_vals + (1 - updated) * self.q_vals
+        changed = np.flatnonzero(new_q_vals != self.q_vals)
+        self.q_vals = new_q_vals
         self.reward_prev = updated * rewards + (1 - updated) * self.reward_prev
 
-
+        if not self.boltzmann:
+            previous_greedy_index = self.greedy_index
+            self.greedy_index = np.argmax(self.q_vals)
+            changed = np.unique([previous_greedy_index, self.greedy_index])
+        self.weights.update(changed, self._compute_weights(changed))
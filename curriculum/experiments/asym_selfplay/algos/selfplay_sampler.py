@@ -0,0 +1,126 @@
+import cloudpickle as pickle
+import numpy as np
+
+from rllab.misc import logger
+from rllab.sampler import parallel_sampler
+from rllab.sampler.base import BaseSampler
+from rllab.sampler.parallel_sampler import _get_scoped_G
+from rllab.sampler.stateful_pool import singleton_pool
+from rllab.sampler.utils import rollout
+from rllab.sampler.vectorized_sampler import vectorized_rollouts
+
+
+def get_bob_envs(G, n_envs):
+    """
+    Return n_envs copies of the Bob env of the AliceEnv populated in G: the env itself followed by clones of it, cached
+    in G until a different env is populated.
+    """
+    env_bob = G.env.env_bob
+    if getattr(G, "bob_envs_source", None) is not env_bob:
+        G.bob_envs = [env_bob]
+        G.bob_envs_source = env_bob
+    if len(G.bob_envs) < n_envs:
+        env_pkl = pickle.dumps(env_bob)
+        G.bob_envs.extend(pickle.loads(env_pkl) for _ in range(n_envs - len(G.bob_envs)))
+    return G.bob_envs[:n_envs]
+
+
+def _worker_terminate_bob_envs(G, scope=None):
+    G = _get_scoped_G(G, scope)
+    for env in getattr(G, "bob_envs", [])[1:]:
+        env.terminate()
+    G.bob_envs = []
+    G.bob_envs_source = None
+
+
+def _worker_collect_alice_path(G, max_path_length, scope=None):
+    G = _get_scoped_G(G, scope)
+    G.env.defer_bob = True
+    try:
+        path = rollout(G.env, G.policy, max_path_length)
+    finally:
+        G.env.defer_bob = False
+    if G.env.alice_end is not None:
+        path["alice_end_obs"], path["t_alice"] = G.env.alice_end
+    return path, len(path["rewards"])
+
+
+def _worker_bob_path_lengths(G, bob_states, max_path_lengths, scope=None):
+    G = _get_scoped_G(G, scope)
+    env_alice = G.env
+    envs = get_bob_envs(G, len(bob_states))
+    for env, bob_state in zip(envs, bob_states):
+        env_alice.set_bob_state(env, bob_state)
+    paths = vectorized_rollouts(envs, env_alice.policy_bob, max_path_lengths)
+    return [len(path["rewards"]) for path in paths]
+
+
+class SelfplaySampler(BaseSampler):
+    """
+    Batch sampler for AliceEnv that does not run Bob inside Alice's step: the Alice episodes are collected first, then
+    the Bob episodes starting from all their end states are rolled out in parallel, n_bob_envs at a time in lockstep
+    in each worker, and Alice's final rewards are filled in afterwards. Pass it as sampler_cls of Alice's algorithm.
+    """
+
+    def __init__(self, algo, n_bob_envs=8):
+        """
+        :type algo: BatchPolopt
+        """
+        self.algo = algo
+        self.n_bob_envs = n_bob_envs
+
+    def start_worker(self):
+        parallel_sampler.populate_task(self.algo.env, self.algo.policy, scope=self.algo.scope)
+
+    def shutdown_worker(self):
+        singleton_pool.run_each(
+            _worker_terminate_bob_envs,
+            [(self.algo.scope,)] * singleton_pool.n_parallel
+        )
+        parallel_sampler.terminate_task(scope=self.algo.scope)
+
+    def obtain_samples(self, itr):
+        cur_params = self.algo.policy.get_param_values()
+        singleton_pool.run_each(
+            parallel_sampler._worker_set_policy_params,
+            [(cur_params, self.algo.scope)] * singleton_pool.n_parallel
+        )
+        paths = singleton_pool.run_collect(
+            _worker_collect_alice_path,
+            threshold=self.algo.batch_size,
+            args=(self.algo.max_path_length, self.algo.scope),
+            show_prog_bar=True
+        )
+        self.add_alice_rewards(paths)
+        if self.algo.whole_paths:
+            return paths
+        else:
+            paths_truncated = parallel_sampler.truncate_paths(paths, self.algo.batch_size)
+            return paths_truncated
+
+    def add_alice_rewards(self, paths):
+        """
+        Run Bob from the end state of every Alice path in which Alice stopped, and set the last reward of that path.
+        """
+        env_alice = self.algo.env
+        ended_paths = [path for path in paths if "alice_end_obs" in path]
+        if len(ended_paths) == 0:
+            logger.record_tabular('BobPathLength', np.nan)
+            return
+        t_alices = [path.pop("t_alice") for path in ended_paths]
+        bob_states = [env_alice.bob_state(path.pop("alice_end_obs")) for path in ended_paths]
+        max_path_lengths = [env_alice.bob_max_path_length(t_alice) for t_alice in t_alices]
+
+        chunks = range(0, len(ended_paths), self.n_bob_envs)
+        t_bobs = singleton_pool.run_map(
+            _worker_bob_path_lengths,
+            [(bob_states[i:i + self.n_bob_envs], max_path_lengths[i:i + self.n_bob_envs], self.algo.scope)
+             for i in chunks]
+        )
+        t_bobs = [t_bob for chunk_t_bobs in t_bobs for t_bob in chunk_t_bobs]
+
+        for path, t_alice, t_bob in zip(ended_paths, t_alices, t_bobs):
+            rewards = np.asarray(path["rewards"], dtype=float)
+            rewards[-1] = env_alice.alice_reward(t_alice, t_bob)
+            path["rewards"] = rewards
+        logger.record_tabular('BobPathLength', np.mean(t_bobs))
@@ -38,10 +38,15 @@ class AliceEnv(ProxyEnv, Serializable):
         self.stop_threshold = stop_threshold
         self.start_generation = start_generation
 
+        # If set, Bob is not run when Alice stops: (end observation, time) is stored in alice_end instead, and the
+        # final reward is left to the sampler (see SelfplaySampler).
+        self.defer_bob = False
+        self.alice_end = None
 
     def reset(self, **kwargs):
         ret = self._wrapped_env.reset(**kwargs)
         self.time = 0
+        self.alice_end = None
         return ret
 
     @property
@@ -54,19 +59,33 @@ class AliceEnv(ProxyEnv, Serializable):
         else:
             raise NotImplementedError
 
-    def compute_alice_reward(self, next_obs):
-        alice_end_obs = next_obs
+    def bob_state(self, alice_end_obs):
+        # The start (or goal) that Bob has to reach back, given the last observation of Alice.
+        if self.start_generation:
+            return self._obs2start_transform(alice_end_obs)
+        else:
+            return self._obs2goal_transform(alice_end_obs)
+
+    def set_bob_state(self, env_bob, bob_state):
         if self.start_generation:
-            bob_start_state = self._obs2start_transform(alice_end_obs)
-            self.env_bob.update_start_generator(FixedStateGenerator(bob_start_state))
+            env_bob.update_start_generator(FixedStateGenerator(bob_state))
         else:
-            bob_goal_state = self._obs2goal_transform(alice_end_obs)
-            self.env_bob.update_goal_generator(FixedStateGenerator(bob_goal_state))
-        path_bob = rollout(self.env_bob, self.policy_bob, max_path_length=max(5, self.max_path_length - self.time), #
+            env_bob.update_goal_generator(FixedStateGenerator(bob_state))
+
+    def bob_max_path_length(self, t_alice):
+        return max(5, self.max_path_length - t_alice)
+
+    def alice_reward(self, t_alice, t_bob):
+        return self.gamma * max(0, self.alice_bonus + t_bob - self.alice_factor * t_alice)
+
+    def compute_alice_reward(self, next_obs):
+        alice_end_obs = next_obs
+        self.set_bob_state(self.env_bob, self.bob_state(alice_end_obs))
+        path_bob = rollout(self.env_bob, self.policy_bob, max_path_length=self.bob_max_path_length(self.time), #
                            animated=False)
         t_alice = self.time
         t_bob = path_bob['rewards'].shape[0]
-        reward = self.gamma * max(0, self.alice_bonus + t_bob - self.alice_factor * t_alice)
+        reward = self.alice_reward(t_alice, t_bob)
 
         # print("t_bob: " + str(t_bob) + ", np.linalg.norm(bob_start_state): " + str(np.linalg.norm(bob_start_state)))
         # print("t_alice: " + str(t_alice), " speed: " + str(np.linalg.norm(bob_start_state) / t_alice))
@@ -93,7 +112,11 @@ class AliceEnv(ProxyEnv, Serializable):
         # Compute the reward for Alice.
         if done or self.time >= self.max_path_length:
             # Alice is done here; we need to run Bob!
-            reward = self.compute_alice_reward(next_obs)
+            if self.defer_bob:
+                self.alice_end = (next_obs, self.time)
+                reward = 0.
+            else:
+                reward = self.compute_alice_reward(next_obs)
         else:
             reward = 0
 
@@ -1,4 +1,5 @@
 import matplotlib
+from curriculum.experiments.asym_selfplay.algos.selfplay_sampler import SelfplaySampler
 from curriculum.experiments.asym_selfplay.envs.alice_env import AliceEnv
 from curriculum.experiments.asym_selfplay.algos.asym_selfplay_batch import generate_states_alice
 
@@ -124,6 +125,7 @@ def run_task(v):
         n_itr=v['inner_iters_alice'],
         step_size=0.01,
         plot=False,
+        sampler_cls=SelfplaySampler,
     )
 
     for outer_iter in range(1, v['outer_iters']):
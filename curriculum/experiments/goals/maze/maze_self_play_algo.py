@@ -1,5 +1,6 @@
 import matplotlib
 from curriculum.envs.start_env import generate_starts_alice
+from curriculum.experiments.asym_selfplay.algos.selfplay_sampler import SelfplaySampler
 from curriculum.experiments.asym_selfplay.envs.alice_env import AliceEnv
 
 matplotlib.use('Agg')
@@ -124,6 +125,7 @@ def run_task(v):
         step_size=0.01,
         discount=v['discount_alice'],
         plot=False,
+        sampler_cls=SelfplaySampler,
     )
 
 
@@ -24,7 +24,7 @@ from rllab.baselines.linear_feature_baseline import LinearFeatureBaseline
 from rllab.envs.normalized_env import normalize
 from rllab.policies.gaussian_mlp_policy import GaussianMLPPolicy
 
-from curriculum.state.evaluator import label_states
+from curriculum.state.evaluator import label_states, label_states_with_paths, PathSummaryReducer
 from curriculum.envs.base import UniformListStateGenerator, UniformStateGenerator, \
     FixedStateGenerator
 from curriculum.state.generator import StateGAN
@@ -113,16 +113,20 @@ def run_task(v):
                 n_itr=v['inner_iters'],
                 step_size=0.01,
                 plot=False,
+                # only keep what label_states_with_paths needs of each path
+                path_reducer=PathSummaryReducer(key='goal_reached', as_goal=True, env=env),
             )
 
-            algo.train()
+            trpo_paths = algo.train()
 
         logger.log('Generating the Heatmap...')
         test_and_plot_policy(policy, env, max_reward=v['max_reward'], sampling_res=sampling_res, n_traj=v['n_traj'],
                              itr=outer_iter, report=report, limit=v['goal_range'], center=v['goal_center'])
 
         logger.log("Labeling the goals")
-        labels = label_states(goals, env, policy, v['horizon'], n_traj=v['n_traj'], key='goal_reached')
+        # the training paths already cover the goals they were trained on: only the missing trajectories are rolled out
+        labels = label_states_with_paths(goals, trpo_paths, env, policy, v['horizon'], n_traj=v['n_traj'],
+                                         key='goal_reached')
 
         plot_labeled_states(goals, labels, report=report, itr=outer_iter, limit=v['goal_range'],
                             center=v['goal_center'], maze_id=v['maze_id'])
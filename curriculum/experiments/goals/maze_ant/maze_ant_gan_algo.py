@@ -130,6 +130,20 @@ def run_task(v):
 
     all_goals = StateCollection(distance_threshold=v['coll_eps'])
 
+    # a single algorithm is trained in all outer iterations, so that its optimizer is compiled and its workers are
+    # populated only once
+    algo = TRPO(
+        env=env,
+        policy=policy,
+        baseline=baseline,
+        batch_size=v['pg_batch_size'],
+        max_path_length=v['horizon'],
+        n_itr=v['inner_iters'],
+        step_size=0.01,
+        plot=False,
+        persistent_workers=True,
+    )
+
     for outer_iter in range(1, v['outer_iters']):
 
         logger.log("Outer itr # %i" % outer_iter)
@@ -152,25 +166,16 @@ def run_task(v):
         # with ExperimentLogger(log_dir, itr_label, snapshot_mode='last', hold_outter_log=True):
         with ExperimentLogger(log_dir, 'last', snapshot_mode='last', hold_outter_log=True):
             logger.log("Updating the environment goal generator")
-            env.update_goal_generator(
+            algo.update_env(
+                'update_goal_generator',
                 UniformListStateGenerator(
                     goals.tolist(), persistence=v['persistence'], with_replacement=v['with_replacement'],
                 )
             )
 
             logger.log("Training the algorithm")
-            algo = TRPO(
-                env=env,
-                policy=policy,
-                baseline=baseline,
-                batch_size=v['pg_batch_size'],
-                max_path_length=v['horizon'],
-                n_itr=v['inner_iters'],
-                step_size=0.01,
-                plot=False,
-            )
-
-            trpo_paths = algo.train()
+            algo.reset_itr()
+            trpo_paths = algo.train(already_init=outer_iter > 1)
 
         if v['use_trpo_paths']:
             logger.log("labeling starts with trpo rollouts")
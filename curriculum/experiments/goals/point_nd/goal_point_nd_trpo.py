@@ -18,6 +18,7 @@ from rllab.misc.instrument import VariantGenerator
 
 from rllab.algos.trpo import TRPO
 from rllab.baselines.linear_feature_baseline import LinearFeatureBaseline
+from rllab.sampler.vectorized_sampler import VectorizedSampler
 
 from curriculum.envs.ndim_point.point_env import PointEnv
 from rllab.envs.normalized_env import normalize
@@ -111,6 +112,8 @@ def run_task(v):
                 discount=0.995,
                 step_size=0.01,
                 plot=False,
+                sampler_cls=VectorizedSampler,
+                sampler_args=dict(n_envs=v['n_envs']),
             )
 
             algo.train()
@@ -218,6 +221,7 @@ if __name__ == '__main__':
     vg.add('outer_iters', [200])
     vg.add('inner_iters', [5])
     vg.add('pg_batch_size', [20000])
+    vg.add('n_envs', [32])  # point envs simulated as one batch by each sampler worker
     # policy initialization
     vg.add('output_gain', [1])
     vg.add('policy_init_std', [1])
@@ -2,6 +2,7 @@ import matplotlib
 import cloudpickle
 import pickle
 
+from curriculum.experiments.asym_selfplay.algos.selfplay_sampler import SelfplaySampler
 from curriculum.experiments.asym_selfplay.envs.alice_env import AliceEnv
 
 matplotlib.use('Agg')
@@ -126,6 +127,7 @@ def run_task(v):
         step_size=0.01,
         discount=v['discount_alice'],
         plot=False,
+        sampler_cls=SelfplaySampler,
     )
 
     for outer_iter in range(1, v['outer_iters']):
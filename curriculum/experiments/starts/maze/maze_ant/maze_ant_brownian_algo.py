@@ -28,7 +28,7 @@ from rllab.envs.normalized_env import normalize
 from rllab.policies.gaussian_mlp_policy import GaussianMLPPolicy
 
 from curriculum.state.evaluator import convert_label, label_states, evaluate_states, label_states_from_paths, \
-    compute_labels
+    compute_labels, PathSummaryReducer
 from curriculum.envs.base import UniformListStateGenerator, UniformStateGenerator, FixedStateGenerator
 from curriculum.state.utils import StateCollection, SmartStateCollection
 
@@ -155,6 +155,23 @@ def run_task(v):
     init_pos = np.array(init_pos)
 
 
+    # a single algorithm is trained in all outer iterations, so that its optimizer is compiled and its workers are
+    # populated only once
+    algo = TRPO(
+        env=env,
+        policy=policy,
+        baseline=baseline,
+        batch_size=v['pg_batch_size'],
+        max_path_length=v['horizon'],
+        n_itr=v['inner_iters'],
+        step_size=0.01,
+        discount=v['discount'],
+        plot=False,
+        # only keep what label_states_from_paths needs of each path
+        path_reducer=PathSummaryReducer(key='goal_reached', as_goal=False, env=env),
+        persistent_workers=True,
+    )
+
     for outer_iter in range(1, v['outer_iters']):
 
         logger.log("Outer itr # %i" % outer_iter)
@@ -193,26 +210,16 @@ def run_task(v):
         # Following code should be indented
         with ExperimentLogger(log_dir, outer_iter // 50, snapshot_mode='last', hold_outter_log=True):
             logger.log("Updating the environment start generator")
-            env.update_start_generator(
+            algo.update_env(
+                'update_start_generator',
                 UniformListStateGenerator(
                     starts.tolist(), persistence=v['persistence'], with_replacement=v['with_replacement'],
                 )
             )
 
             logger.log("Training the algorithm")
-            algo = TRPO(
-                env=env,
-                policy=policy,
-                baseline=baseline,
-                batch_size=v['pg_batch_size'],
-                max_path_length=v['horizon'],
-                n_itr=v['inner_iters'],
-                step_size=0.01,
-                discount=v['discount'],
-                plot=False,
-            )
-
-            trpo_paths = algo.train()
+            algo.reset_itr()
+            trpo_paths = algo.train(already_init=outer_iter > 1)
 
 
 
@@ -151,12 +151,7 @@ def run_task(v):
         # Following code should be indented
         with ExperimentLogger(log_dir, outer_iter // 50, snapshot_mode='last', hold_outter_log=True):
             logger.log("Updating the environment start generator")
-            #TODO: might be faster to sample if we just create a roughly representative UniformListStateGenerator?
-            env.update_start_generator(
-                ListStateGenerator(
-                    init_pos, dist
-                )
-            )
+            env.update_start_generator(online_start_generator.get_state_generator())
 
             logger.log("Training the algorithm")
             algo = TRPO(
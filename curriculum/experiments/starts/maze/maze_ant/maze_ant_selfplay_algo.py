@@ -2,6 +2,7 @@ import matplotlib
 import cloudpickle
 import pickle
 
+from curriculum.experiments.asym_selfplay.algos.selfplay_sampler import SelfplaySampler
 from curriculum.experiments.asym_selfplay.envs.alice_env import AliceEnv
 from curriculum.logging.visualization import plot_labeled_states
 
@@ -124,6 +125,7 @@ def run_task(v):
         step_size=0.01,
         discount=v['discount_alice'],
         plot=False,
+        sampler_cls=SelfplaySampler,
     )
 
     # load the state collection from data_upload
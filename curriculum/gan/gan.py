@@ -25,6 +25,7 @@ DEFAULT_GAN_CONFIGS = lambda: {
     'default_discriminator_iters': 1,
     'gan_type': 'lsgan',
     'wgan_gradient_penalty': 0.1,
+    'fused_training': False,  # one session call per outer iteration of train, with the data preloaded in the graph
 }
 
 
@@ -41,10 +42,7 @@ def batch_feed_array(array, batch_size):
             if start + batch_size < data_size:
                 yield array[start:start + batch_size, ...]
             else:
-                yield np.concatenate(
-                    [array[start:data_size], array[0: start + batch_size - data_size]],
-                    axis=0
-                )
+                yield np.take(array, np.arange(start, start + batch_size), axis=0, mode='wrap')
             start = (start + batch_size) % data_size
 
 
@@ -65,11 +63,17 @@ class FCGAN(object):
         self.generator_is_training = tf.placeholder_with_default(False, [])
         self.discriminator_is_training = tf.placeholder_with_default(False, [])
 
+        if self.configs['fused_training']:
+            # the fused training step draws the noise in the graph when it is not fed
+            noise_default = tf.random_normal([self.configs['batch_size'], noise_size])
+        else:
+            noise_default = None
+
         # with self.tf_graph.as_default():
         with tf.variable_scope("generator"):
             self.generator = Generator(
                 generator_output_size, generator_layers, noise_size,
-                self.generator_is_training, self.configs,
+                self.generator_is_training, self.configs, noise_default=noise_default,
             )
 
         with tf.variable_scope("discriminator"):
@@ -100,6 +104,9 @@ class FCGAN(object):
                 var_list=self.discriminator_variables
             )
 
+        if self.configs['fused_training']:
+            self._build_fused_train_op(discriminator_layers)
+
         self.generator_optimizer_variables = tf.get_collection(
             tf.GraphKeys.GLOBAL_VARIABLES,
             'fcgan_generator_optimizer'
@@ -135,6 +142,66 @@ class FCGAN(object):
             self.initialize_discriminator_optimizer_op
         )
 
+    def _build_fused_train_op(self, discriminator_layers):
+        """
+        Build a training step doing the same as one outer iteration of train (with one discriminator and one generator
+        iteration) in a single session call: the real batch is gathered from a dataset preloaded in the graph, and the
+        generator samples come from noise drawn in the graph. The generator is updated after the discriminator, against
+        its updated weights, using the same noise.
+        """
+        batch_size = self.configs['batch_size']
+        with tf.variable_scope('fcgan_dataset'):
+            self._dataset_X_input = tf.placeholder(tf.float32, shape=[None, self.generator_output_size])
+            self._dataset_Y_input = tf.placeholder(tf.float32, shape=[None, self.discriminator_output_size])
+            # not in any collection: they are not trained, initialized nor saved with the rest of the variables
+            dataset_X = tf.Variable(self._dataset_X_input, trainable=False, validate_shape=False, collections=[])
+            dataset_Y = tf.Variable(self._dataset_Y_input, trainable=False, validate_shape=False, collections=[])
+            offset = tf.Variable(0, trainable=False, collections=[])
+            self._load_dataset_op = tf.group(dataset_X.initializer, dataset_Y.initializer, offset.initializer)
+
+            # same batches as batch_feed_array
+            data_size = tf.shape(dataset_X)[0]
+            indices = tf.mod(offset + tf.range(tf.minimum(batch_size, data_size)), data_size)
+            real_X = tf.gather(dataset_X, indices)
+            real_Y = tf.gather(dataset_Y, indices)
+            with tf.control_dependencies([real_X, real_Y]):
+                advance_offset = tf.assign(offset, tf.mod(offset + batch_size, data_size))
+
+        generated_X = tf.stop_gradient(self.generator.output)
+        generated_Y = tf.zeros(tf.stack([tf.shape(generated_X)[0], self.discriminator_output_size]))
+        train_X = tf.concat([real_X, generated_X], 0)
+        train_Y = tf.concat([real_Y, generated_Y], 0)
+
+        with tf.variable_scope('discriminator', reuse=True):
+            train_net = DiscriminatorNet(
+                train_X, discriminator_layers, self.discriminator_output_size,
+                self.discriminator_is_training, self.configs, reuse=True
+            )
+        self._fused_discriminator_loss = self.discriminator.build_discriminator_loss(
+            train_X, train_net.output, train_Y
+        )
+        with tf.variable_scope('fcgan_discriminator_optimizer'):
+            discriminator_train_op = self.configs['discriminator_optimizer'].minimize(
+                self._fused_discriminator_loss,
+                var_list=self.discriminator_variables
+            )
+
+        # everything created here reads the discriminator weights after its update
+        with tf.control_dependencies([discriminator_train_op]):
+            with tf.variable_scope('discriminator', reuse=True):
+                generator_net = DiscriminatorNet(
+                    self.generator.output, discriminator_layers, self.discriminator_output_size,
+                    self.discriminator_is_training, self.configs, reuse=True
+                )
+            self._fused_generator_loss = self.discriminator.build_generator_loss(generator_net.output)
+            with tf.variable_scope('fcgan_generator_optimizer'):
+                generator_train_op = self.configs['generator_optimizer'].minimize(
+                    self._fused_generator_loss,
+                    var_list=self.generator_variables
+                )
+
+        self._fused_train_op = tf.group(discriminator_train_op, generator_train_op, advance_offset)
+
     def initialize(self):
         self.tf_session.run(
             self.initialize_trainable_variable_op
@@ -150,26 +217,24 @@ class FCGAN(object):
         return np.random.randn(size, self.noise_size)
 
     def sample_generator(self, size):
-        generator_samples = []
-        generator_noise = []
-        batch_size = self.configs['batch_size']
-        for i in range(0, size, batch_size):
-            sample_size = min(batch_size, size - i)
-            noise = self.sample_random_noise(sample_size)
-            generator_noise.append(noise)
-            generator_samples.append(
-                self.tf_session.run(
-                    self.generator.output,
-                    {self.generator.input: noise}
-                )
-            )
-        return np.vstack(generator_samples), np.vstack(generator_noise)
+        # batch normalization runs in inference mode when sampling, so the samples do not depend on the batching
+        noise = self.sample_random_noise(size)
+        generator_samples = self.tf_session.run(
+            self.generator.output,
+            {self.generator.input: noise}
+        )
+        return generator_samples, noise
 
     def train(self, X, Y, outer_iters, generator_iters=None, discriminator_iters=None):
         if generator_iters is None:
             generator_iters = self.configs['default_generator_iters']
         if discriminator_iters is None:
             discriminator_iters = self.configs['default_discriminator_iters']
+
+        if self.configs['fused_training'] and generator_iters == 1 and discriminator_iters == 1 \
+                and not self.configs['batch_normalize_generator'] \
+                and not self.configs['batch_normalize_discriminator']:
+            return self._train_fused(X, Y, outer_iters)
         
         sample_size = X.shape[0]
         train_size = sample_size
@@ -215,6 +280,30 @@ class FCGAN(object):
 
         return dis_log_loss, gen_log_loss
 
+    def _train_fused(self, X, Y, outer_iters):
+        self.tf_session.run(
+            self._load_dataset_op,
+            {self._dataset_X_input: X, self._dataset_Y_input: Y}
+        )
+        for i in range(outer_iters):
+            if self.configs['reset_generator_optimizer']:
+                self.tf_session.run(
+                    self.initialize_generator_optimizer_op
+                )
+            if self.configs['reset_discriminator_optimizer']:
+                self.tf_session.run(
+                    self.initialize_discriminator_optimizer_op
+                )
+
+            dis_log_loss, gen_log_loss, _ = self.tf_session.run(
+                [self._fused_discriminator_loss, self._fused_generator_loss, self._fused_train_op]
+            )
+
+            if i % self.configs['print_iteration'] == 0 and not self.configs['supress_all_logging']:
+                print('Iter: {}, generator loss: {}, discriminator loss: {}'.format(i, gen_log_loss, dis_log_loss))
+
+        return dis_log_loss, gen_log_loss
+
     def train_discriminator(self, X, Y, iters, no_batch=False):
         """
         :param X: goal that we know lables of
@@ -267,23 +356,19 @@ class FCGAN(object):
         return loss
 
     def discriminator_predict(self, X):
-        batch_size = self.configs['batch_size']
-        output = []
-        for i in range(0, X.shape[0], batch_size):
-            sample_size = min(batch_size, X.shape[0] - i)
-            output.append(
-                self.tf_session.run(
-                    self.discriminator.sample_output,
-                    {self.discriminator.sample_input: X[i:i + sample_size]}
-                )
-            )
-        return np.vstack(output)
+        return self.tf_session.run(
+            self.discriminator.sample_output,
+            {self.discriminator.sample_input: X}
+        )
 
 
 class Generator(object):
-    def __init__(self, output_size, hidden_layers, noise_size, is_training, configs):
+    def __init__(self, output_size, hidden_layers, noise_size, is_training, configs, noise_default=None):
         self.configs = configs
-        self._input = tf.placeholder(tf.float32, shape=[None, noise_size])
+        if noise_default is None:
+            self._input = tf.placeholder(tf.float32, shape=[None, noise_size])
+        else:
+            self._input = tf.placeholder_with_default(noise_default, shape=[None, noise_size])
         out = self._input
 
         for size in hidden_layers:
@@ -347,59 +432,73 @@ class Discriminator(object):
         )
         
         
-        if configs['gan_type'] == 'wgan':
+        if configs['gan_type'] not in ('wgan', 'lsgan', 'original'):
+            raise ValueError('Unsupported GAN type!')
+
+        if configs['gan_type'] == 'original':
+            self._generator_output = tf.sigmoid(self.generator_discriminator.output)
+            self._sample_output = tf.sigmoid(self.sample_discriminator.output)
+        else:
             self._generator_output = self.generator_discriminator.output
             self._sample_output = self.sample_discriminator.output
-            
-            self._discriminator_loss_logits = tf.reduce_mean(
-                -2 * (self._label - 0.5) * self._sample_output
+
+        self._discriminator_loss = self.build_discriminator_loss(
+            self._sample_input, self.sample_discriminator.output, self._label
+        )
+        self._generator_loss = self.build_generator_loss(self.generator_discriminator.output)
+
+    def build_discriminator_loss(self, sample_input, sample_logits, label):
+        """
+        :param sample_input: input of the discriminator net
+        :param sample_logits: output of the discriminator net on sample_input
+        :param label: labels of sample_input
+        """
+        if self.configs['gan_type'] == 'wgan':
+            loss_logits = tf.reduce_mean(
+                -2 * (label - 0.5) * sample_logits
             )
-            
-            
-            self._discriminator_loss_gradient = tf.nn.relu(
+            loss_gradient = tf.nn.relu(
                 tf.nn.l2_loss(
                     tf.gradients(
-                        self._discriminator_loss_logits, self._sample_input
+                        loss_logits, sample_input
                     )[0]
                 ) - 1
-            ) * configs['wgan_gradient_penalty']
-            
-            self._discriminator_loss = self._discriminator_loss_logits + self._discriminator_loss_gradient
-    
-            self._generator_loss = tf.reduce_mean(
-                -self._generator_output
-            )
-            
-        elif configs['gan_type'] == 'lsgan':
-            self._generator_output = self.generator_discriminator.output
-            self._sample_output = self.sample_discriminator.output
-            
-            self._discriminator_loss = tf.reduce_mean(
-                tf.square(2 * self._label - 1 - self._sample_output)
-            )
-            
-            self._generator_loss = tf.reduce_mean(
-                tf.square(self._generator_output - 1)
+            ) * self.configs['wgan_gradient_penalty']
+            return loss_logits + loss_gradient
+
+        elif self.configs['gan_type'] == 'lsgan':
+            return tf.reduce_mean(
+                tf.square(2 * label - 1 - sample_logits)
             )
-        
-        elif configs['gan_type'] == 'original':
-            self._generator_output = tf.sigmoid(self.generator_discriminator.output)
-            self._sample_output = tf.sigmoid(self.sample_discriminator.output)
-    
-            self._discriminator_loss = tf.reduce_mean(
+
+        else:
+            return tf.reduce_mean(
                 tf.nn.sigmoid_cross_entropy_with_logits(
-                    labels=self._label, logits=self.sample_discriminator.output
+                    labels=label, logits=sample_logits
                 )
             )
-    
-            self._generator_loss = tf.reduce_mean(
+
+    def build_generator_loss(self, generator_logits):
+        """
+        :param generator_logits: output of the discriminator net on the samples of the generator
+        """
+        if self.configs['gan_type'] == 'wgan':
+            return tf.reduce_mean(
+                -generator_logits
+            )
+
+        elif self.configs['gan_type'] == 'lsgan':
+            return tf.reduce_mean(
+                tf.square(generator_logits - 1)
+            )
+
+        else:
+            return tf.reduce_mean(
                 tf.nn.sigmoid_cross_entropy_with_logits(
-                    labels=tf.ones_like(self.generator_discriminator.output),
-                    logits=self.generator_discriminator.output
+                    labels=tf.ones_like(generator_logits),
+                    logits=generator_logits
                 )
             )
-        else:
-            raise ValueError('Unsupported GAN type!')
 
     @property
     def sample_input(self):
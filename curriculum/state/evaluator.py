@@ -1,12 +1,17 @@
+import atexit
 import multiprocessing
 import os
 import tempfile
 import numpy as np
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 import cloudpickle
 import time
 
 from rllab.sampler.utils import rollout
+from rllab.sampler import parallel_sampler
+from rllab.sampler.parallel_sampler import _get_scoped_G
+from rllab.sampler.stateful_pool import singleton_pool
+from rllab.sampler.vectorized_sampler import vectorized_rollouts, get_vec_envs, env_fingerprint
 from rllab.misc import logger
 
 from curriculum.envs.base import FixedStateGenerator
@@ -51,30 +56,124 @@ def disable_cuda_initializer(*args, **kwargs):
     os.environ['CUDA_VISIBLE_DEVICES'] = ''
 
 
+# scope under which the evaluation env and policy are kept resident in the singleton_pool workers
+EVALUATION_SCOPE = 'state_evaluator'
+
+# fingerprint of the env populated under each evaluation scope, see evaluation_env_fingerprint
+_evaluation_fingerprints = dict()
+
+# process pools that are not the singleton_pool are created once per size and kept alive until
+# terminate_evaluation_task is called or the process exits
+_persistent_pools = dict()
+
+
+def close_persistent_pools():
+    for pool in _persistent_pools.values():
+        pool.close()
+        pool.join()
+    _persistent_pools.clear()
+
+
+atexit.register(close_persistent_pools)
+
+
+def _get_persistent_pool(num_processes):
+    if singleton_pool.pool is not None and num_processes == singleton_pool.n_parallel:
+        return singleton_pool.pool
+    if num_processes not in _persistent_pools:
+        _persistent_pools[num_processes] = multiprocessing.Pool(
+            num_processes,
+            initializer=disable_cuda_initializer
+        )
+    return _persistent_pools[num_processes]
+
+
 def parallel_map(func, iterable_object, num_processes=-1):
     """Parallelized map function based on python process
     Args:
     func: Pickleable callable object that takes one parameter.
     iterable_object: An iterable of elements to map the function on.
     num_processes: Number of process to use. When num_processes is 1,
-                   no new process will be created.
+                   no new process will be created. When -1, the workers of the
+                   singleton_pool are reused. Any other pool is created on the first
+                   call and kept alive for the following ones.
     Returns:
     The list resulted in calling the func on all objects in the original list.
     """
-    if num_processes == 1:
-        return [func(x) for x in iterable_object]
     if num_processes == -1:
-        from rllab.sampler.stateful_pool import singleton_pool
         num_processes = singleton_pool.n_parallel
-    process_pool = multiprocessing.Pool(
-        num_processes,
-        initializer=disable_cuda_initializer
-    )
-    results = process_pool.map(func, iterable_object)
-    process_pool.close()
-    process_pool.join()
+    if num_processes == 1:
+        return [func(x) for x in iterable_object]
+    process_pool = _get_persistent_pool(num_processes)
+    return process_pool.map(func, iterable_object)
+
+
+def evaluation_env_fingerprint(env, as_goals=True):
+    """
+    env_fingerprint of env leaving out the goal (or start) generator, which is overwritten by every evaluation.
+    """
+    if as_goals:
+        generator = env.goal_generator
+        env.update_goal_generator(None)
+    else:
+        generator = env.start_generator
+        env.update_start_generator(None)
+    try:
+        return env_fingerprint(env)
+    finally:
+        if as_goals:
+            env.update_goal_generator(generator)
+        else:
+            env.update_start_generator(generator)
+
+
+def populate_evaluation_task(env, policy, scope=EVALUATION_SCOPE, fingerprint=None):
+    """
+    Ship env and policy to the singleton_pool workers, where they stay resident under the given scope, so that later
+    evaluations only transfer the flat policy parameters and the states to evaluate. The env is shipped again
+    whenever a different env or policy is given or its fingerprint (see evaluation_env_fingerprint) changes, so that
+    changes to env other than the generator being evaluated reach the workers.
+    """
+    if fingerprint is not None and _evaluation_fingerprints.get(scope) != fingerprint:
+        if singleton_pool.n_parallel > 1:
+            # forces populate_task to send the modified env
+            parallel_sampler._cached_populate_env.pop(scope, None)
+        _evaluation_fingerprints[scope] = fingerprint
+    parallel_sampler.populate_task(env, policy, scope=scope)
+
+
+def terminate_evaluation_task(scope=EVALUATION_SCOPE):
+    if scope in parallel_sampler._cached_populate_env:
+        parallel_sampler.terminate_task(scope=scope)
+    _evaluation_fingerprints.pop(scope, None)
+    close_persistent_pools()
+
+
+def _split_in_chunks(states, n_chunks):
+    n_chunks = max(1, min(n_chunks, len(states)))
+    bounds = np.linspace(0, len(states), n_chunks + 1).astype(int)
+    return [states[bounds[i]:bounds[i + 1]] for i in range(n_chunks)]
+
+
+def _worker_evaluate_states(G, states, policy_params, scope, eval_kwargs, n_envs=1, env_key=None):
+    G = _get_scoped_G(G, scope)
+    G.policy.set_param_values(policy_params)
+    # the env may be the one of the master process if there is no parallelism: leave its generators untouched
+    if eval_kwargs['as_goals']:
+        old_generator = G.env.goal_generator
+    else:
+        old_generator = G.env.start_generator
+    if n_envs > 1:
+        results = evaluate_states_vectorized(states, get_vec_envs(G, n_envs, env_key), G.policy, **eval_kwargs)
+    else:
+        results = [evaluate_state(state, G.env, G.policy, **eval_kwargs) for state in states]
+    if eval_kwargs['as_goals']:
+        G.env.update_goal_generator(old_generator)
+    else:
+        G.env.update_start_generator(old_generator)
     return results
 
+
 def compute_rewards_from_paths(all_paths, key='rewards', as_goal=True, env=None, terminal_eps=0.1):
     all_rewards = []
     all_states = []
@@ -108,43 +207,136 @@ def compute_rewards_from_paths(all_paths, key='rewards', as_goal=True, env=None,
     return [all_states, all_rewards]
 
 
+class PathSummary(namedtuple('PathSummary', ['state', 'reward', 'length'])):
+    """ Compact replacement of a path: its start or goal, its aggregated reward and its length. """
+    __slots__ = ()
+
+
+def get_path_state(path, as_goal=True, env=None):
+    """ Start (transformed to the start space) or goal of the given path, as a tuple usable as dictionary key. """
+    if as_goal:
+        return tuple(path['env_infos']['goal'][0])
+    env_infos_first_time_step = {key: value[0] for key, value in path['env_infos'].items()}
+    return tuple(env.transform_to_start_space(path['observations'][0], env_infos_first_time_step))
+
+
+def summarize_paths(paths, key='rewards', as_goal=True, env=None):
+    return [
+        PathSummary(state=get_path_state(path, as_goal=as_goal, env=env), reward=evaluate_path(path, key=key),
+                    length=len(path['rewards']))
+        for path in paths
+    ]
+
+
+class StateRewards(namedtuple('StateRewards', ['states', 'rewards', 'lengths'])):
+    """ PathSummary of a whole batch of paths: arrays with the start or goal, reward and length of each path. """
+    __slots__ = ()
+
+
+def summarize_paths_batch(paths, key='rewards', as_goal=True, env=None):
+    return StateRewards(
+        states=np.array([get_path_state(path, as_goal=as_goal, env=env) for path in paths], dtype=float),
+        rewards=np.array([evaluate_path(path, key=key) for path in paths], dtype=float),
+        lengths=np.array([len(path['rewards']) for path in paths], dtype=int),
+    )
+
+
+class PathSummaryReducer(object):
+    """
+    Path reducer for BatchPolopt: keeps only the start or goal, the reward and the length of each path (as a
+    StateRewards batch) instead of the full paths, so that the output of algo.train can be fed to
+    label_states_from_paths or label_states_with_paths without holding every observation in memory.
+    """
+
+    def __init__(self, key='rewards', as_goal=True, env=None):
+        self.key = key
+        self.as_goal = as_goal
+        self.env = env
+
+    def __call__(self, paths):
+        return summarize_paths_batch(paths, key=self.key, as_goal=self.as_goal, env=self.env)
+
+
+def group_states(states):
+    """
+    Give an ID to each distinct row of states, numbering them in order of first occurrence.
+    :return: the distinct states, and the ID of every row of states
+    """
+    if len(states) == 0:
+        return np.zeros((0, 0)), np.zeros(0, dtype=int)
+    # adding 0. turns -0. into 0., which is the same state
+    states = np.asarray(states, dtype=float).reshape(len(states), -1) + 0.
+    distinct_states, first_index, ids = np.unique(states, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first_index)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return distinct_states[order], rank[ids.reshape(-1)]
+
+
+def collect_state_rewards(all_paths, key='rewards', as_goal=True, env=None):
+    """
+    Start or goal and reward of every path, as arrays.
+    :param all_paths: iterable of StateRewards, or of lists of paths or PathSummary (the reward of a summary was
+    already aggregated by its reducer, so key is not used for them). It is consumed only once.
+    """
+    states = []
+    rewards = []
+    for paths in all_paths:
+        if not isinstance(paths, StateRewards):
+            paths = StateRewards(
+                states=[path.state if isinstance(path, PathSummary) else get_path_state(path, as_goal=as_goal, env=env)
+                        for path in paths],
+                rewards=[path.reward if isinstance(path, PathSummary) else evaluate_path(path, key=key)
+                         for path in paths],
+                lengths=None,
+            )
+        if len(paths.states) > 0:
+            states.append(np.asarray(paths.states, dtype=float))
+            rewards.append(np.asarray(paths.rewards, dtype=float))
+    if len(states) == 0:
+        return np.zeros((0, 0)), np.zeros(0)
+    return np.concatenate(states), np.concatenate(rewards)
+
+
+def aggregate_state_rewards(states, rewards, ids_of=None):
+    """
+    Number of rewards and sum of the rewards of each distinct state, with bincount.
+    :param ids_of: optional states whose IDs are also returned (they are numbered first)
+    :return: distinct states, counts, reward sums (and the IDs of ids_of, if given)
+    """
+    n_ids_of = 0 if ids_of is None else len(ids_of)
+    if n_ids_of > 0:
+        ids_of = np.asarray(ids_of, dtype=float).reshape(n_ids_of, -1)
+        states = np.concatenate([ids_of, states]) if len(states) > 0 else ids_of
+    distinct_states, ids = group_states(states)
+    counts = np.bincount(ids[n_ids_of:], minlength=len(distinct_states))
+    sums = np.bincount(ids[n_ids_of:], weights=rewards, minlength=len(distinct_states))
+    if ids_of is None:
+        return distinct_states, counts, sums
+    return distinct_states, counts, sums, ids[:n_ids_of]
+
+
 def label_states_from_paths(all_paths, min_reward=0, max_reward=1, key='rewards', as_goal=True,
                  old_rewards=None, improvement_threshold=0, n_traj=1, env=None, return_mean_rewards = False,
                             order_of_states = None):
-    state_dict = {}
-    for paths in all_paths:
-        for path in paths:
-            reward = evaluate_path(path, key=key)
-            if as_goal:
-                state = tuple(path['env_infos']['goal'][0])
-            else:
-                env_infos_first_time_step = {key: value[0] for key, value in path['env_infos'].items()}
-                state = tuple(env.transform_to_start_space(path['observations'][0], env_infos_first_time_step))
-            if state in state_dict:
-                state_dict[state].append(reward)
-            else:
-                state_dict[state] = [reward]
-
-    states = []
-    unlabeled_state = []
-    mean_rewards = []
+    """
+    :param all_paths: iterable of StateRewards, or of lists of paths or PathSummary (the reward of a summary was
+    already aggregated by its reducer, so key is not used for them). It is consumed only once, so it can be a generator.
+    """
+    path_states, path_rewards = collect_state_rewards(all_paths, key=key, as_goal=as_goal, env=env)
 
     if order_of_states is None:
-        for state, rewards in state_dict.items():
-            if len(rewards) >= n_traj:
-                states.append(list(state))
-                mean_rewards.append(np.mean(rewards))
+        distinct_states, counts, sums = aggregate_state_rewards(path_states, path_rewards)
+        labeled = counts >= max(n_traj, 1)
+        states = distinct_states[labeled]
+        mean_rewards = sums[labeled] / counts[labeled]
     # case where you want states returned in a specific order (useful for TSCL)
     else:
-        updated = []
-        for state in order_of_states:
-            states.append(state)
-            if state not in state_dict or len(state_dict[tuple(state)]) < n_traj:
-                mean_rewards.append(0)
-                updated.append(False)
-            else:
-                mean_rewards.append(np.mean(state_dict[tuple(state)]))
-                updated.append(True)
+        _, counts, sums, ids = aggregate_state_rewards(path_states, path_rewards, ids_of=order_of_states)
+        counts, sums = counts[ids], sums[ids]
+        updated = list((counts > 0) & (counts >= n_traj))
+        mean_rewards = np.where(updated, sums / np.maximum(counts, 1), 0)
+        states = np.array(order_of_states)
 
     # Make this a vertical list.
     mean_rewards = np.array(mean_rewards).reshape(-1, 1)
@@ -152,7 +344,6 @@ def label_states_from_paths(all_paths, min_reward=0, max_reward=1, key='rewards'
     labels = compute_labels(mean_rewards, old_rewards=old_rewards, min_reward=min_reward, max_reward=max_reward,
                             improvement_threshold=improvement_threshold)
 
-    states = np.array(states)
     if return_mean_rewards:
         if order_of_states is not None:
             return [states, labels, mean_rewards, updated] # updated is used for curriculum learning
@@ -160,6 +351,37 @@ def label_states_from_paths(all_paths, min_reward=0, max_reward=1, key='rewards'
     return [states, labels]
 
 
+def label_states_with_paths(states, all_paths, env, policy, horizon, as_goals=True, min_reward=0.1, max_reward=0.9,
+                            key='rewards', old_rewards=None, improvement_threshold=0.1, n_traj=1, n_processes=-1,
+                            n_envs=1, return_rew=False):
+    """
+    Same as label_states, but the rewards of the given paths (e.g. the training paths of the last outer iteration,
+    see label_states_from_paths for the accepted formats) are used: only the states with less than n_traj paths
+    are rolled out again, and only for the missing trajectories.
+    """
+    path_states, path_rewards = collect_state_rewards(all_paths, key=key, as_goal=as_goals, env=env)
+    _, counts, sums, ids = aggregate_state_rewards(path_states, path_rewards, ids_of=states)
+    counts, sums = counts[ids].astype(float), sums[ids]
+
+    missing = np.maximum(n_traj - counts, 0).astype(int)
+    logger.log("Labelling states: {} of {} states need {} extra rollouts".format(
+        np.sum(missing > 0), len(missing), np.sum(missing)))
+    states = np.asarray(states)
+    for n_missing in np.unique(missing[missing > 0]).tolist():
+        idx = np.flatnonzero(missing == n_missing)
+        mean_rewards = evaluate_states(states[idx], env, policy, horizon, n_traj=n_missing, n_processes=n_processes,
+                                       key=key, as_goals=as_goals, n_envs=n_envs)
+        sums[idx] += mean_rewards * n_missing
+        counts[idx] += n_missing
+
+    mean_rewards = (sums / np.maximum(counts, 1)).reshape(-1, 1)
+    labels = compute_labels(mean_rewards, old_rewards=old_rewards, min_reward=min_reward, max_reward=max_reward,
+                            improvement_threshold=improvement_threshold)
+    if return_rew:
+        return labels, mean_rewards
+    return labels
+
+
 def label_states(states, env, policy, horizon, as_goals=True, min_reward=0.1, max_reward=0.9, key='rewards',
                  old_rewards=None, improvement_threshold=0.1, n_traj=1, n_processes=-1, full_path=False, return_rew=False):
     logger.log("Labelling starts")
@@ -241,11 +463,12 @@ def convert_label(labels):
 
 def evaluate_states(states, env, policy, horizon, n_traj=1, n_processes=-1, full_path=False, key='rewards',
                     as_goals=True,
-                    aggregator=(np.sum, np.mean)):
-    evaluate_state_wrapper = FunctionWrapper(
-        evaluate_state,
-        env=env,
-        policy=policy,
+                    aggregator=(np.sum, np.mean), n_envs=1):
+    """
+    :param n_envs: if bigger than 1, each worker steps n_envs copies of env in lockstep with a single policy
+    forward pass per time step (only used with n_processes=-1)
+    """
+    eval_kwargs = dict(
         horizon=horizon,
         n_traj=n_traj,
         full_path=full_path,
@@ -253,11 +476,29 @@ def evaluate_states(states, env, policy, horizon, n_traj=1, n_processes=-1, full
         as_goals=as_goals,
         aggregator=aggregator,
     )
-    result = parallel_map(  # if full_path this is a list of tuples
-        evaluate_state_wrapper,
-        states,
-        n_processes,
-    )
+    if n_processes == -1:
+        # use the resident copies of env and policy in the singleton_pool workers
+        fingerprint = evaluation_env_fingerprint(env, as_goals)
+        populate_evaluation_task(env, policy, fingerprint=fingerprint)
+        policy_params = policy.get_param_values()
+        chunks = _split_in_chunks(states, 4 * singleton_pool.n_parallel)
+        result = singleton_pool.run_map(
+            _worker_evaluate_states,
+            [(chunk, policy_params, EVALUATION_SCOPE, eval_kwargs, n_envs, fingerprint) for chunk in chunks]
+        )
+        result = [state_result for chunk_result in result for state_result in chunk_result]
+    else:
+        evaluate_state_wrapper = FunctionWrapper(
+            evaluate_state,
+            env=env,
+            policy=policy,
+            **eval_kwargs
+        )
+        result = parallel_map(  # if full_path this is a list of tuples
+            evaluate_state_wrapper,
+            states,
+            n_processes,
+        )
 
     if full_path:
         return np.array([state[0] for state in result]), [path for state in result for path in state[1]]
@@ -293,6 +534,33 @@ def evaluate_state(state, env, policy, horizon, n_traj=1, full_path=False, key='
     return mean_reward
 
 
+def evaluate_states_vectorized(states, envs, policy, horizon, n_traj=1, full_path=False, key='rewards', as_goals=True,
+                               aggregator=(np.sum, np.mean)):
+    """ Same as calling evaluate_state on each state, but the n_traj rollouts of all states are run in batches of
+    len(envs) with vectorized_rollouts. """
+    jobs = [(idx, state) for idx, state in enumerate(states) for _ in range(n_traj)]
+    state_paths = [[] for _ in range(len(states))]
+    for batch_start in range(0, len(jobs), len(envs)):
+        batch = jobs[batch_start:batch_start + len(envs)]
+        batch_envs = envs[:len(batch)]
+        for env, (_, state) in zip(batch_envs, batch):
+            if as_goals:
+                env.update_goal_generator(FixedStateGenerator(state))
+            else:
+                env.update_start_generator(FixedStateGenerator(state))
+        for (idx, _), path in zip(batch, vectorized_rollouts(batch_envs, policy, horizon)):
+            state_paths[idx].append(path)
+
+    results = []
+    for paths in state_paths:
+        aggregated_data = [
+            aggregator[0](path[key]) if key in path else aggregator[0](path['env_infos'][key]) for path in paths
+        ]
+        mean_reward = aggregator[1](aggregated_data)
+        results.append((mean_reward, paths) if full_path else mean_reward)
+    return results
+
+
 def evaluate_state_env(env, policy, horizon, n_states=10, n_traj=1, n_processes=-1, **kwargs):
     evaluate_env_wrapper = FunctionWrapper(
         rollout,
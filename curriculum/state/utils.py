@@ -18,31 +18,201 @@ import scipy.misc
 from curriculum.state.evaluator import parallel_map, disable_cuda_initializer
 
 
+class StateIndex(object):
+    """
+    Incremental index answering whether points have a stored neighbor within a given radius. Added points go to a
+    small buffer that is checked by brute force; full buffers become cKDTrees, which are merged while the newest tree
+    is at least as big as the previous one, so that there are only O(log n) trees at any time.
+    """
+
+    def __init__(self, buffer_size=512):
+        self.buffer_size = buffer_size
+        self.trees = []
+        self.buffer = []
+        self.size = 0
+
+    def add(self, points):
+        points = np.asarray(points, dtype=float)
+        if len(points) == 0:
+            return
+        self.buffer.append(points)
+        self.size += len(points)
+        if sum(len(b) for b in self.buffer) >= self.buffer_size:
+            data = np.concatenate(self.buffer)
+            self.buffer = []
+            while len(self.trees) > 0 and self.trees[-1].n <= len(data):
+                data = np.concatenate([self.trees.pop().data, data])
+            self.trees.append(scipy.spatial.cKDTree(data))
+
+    def has_neighbor(self, points, radius):
+        """ Boolean mask of the points that have a stored point at distance <= radius. """
+        points = np.asarray(points, dtype=float)
+        mask = np.zeros(len(points), dtype=bool)
+        if len(points) == 0:
+            return mask
+        for tree in self.trees:
+            mask |= tree.query_ball_point(points, radius, return_length=True) > 0
+        if len(self.buffer) > 0:
+            mask |= np.amin(scipy.spatial.distance.cdist(np.concatenate(self.buffer), points), axis=0) <= radius
+        return mask
+
+
+def filter_close_points(points, radius, chunk_size=256):
+    """
+    Greedily keep the points that are at more than radius from all the previously kept ones, in order. The points are
+    processed in chunks: the ones close to a point kept in a previous chunk are dropped at once with a StateIndex of
+    the kept points, and only the remaining ones are compared with each other.
+    :return: boolean mask of the kept points
+    """
+    points = np.asarray(points, dtype=float)
+    keep = np.zeros(len(points), dtype=bool)
+    kept_index = StateIndex()
+    for start in range(0, len(points), chunk_size):
+        candidates = start + np.flatnonzero(~kept_index.has_neighbor(points[start:start + chunk_size], radius))
+        if len(candidates) == 0:
+            continue
+        neighbors = scipy.spatial.cKDTree(points[candidates]).query_ball_point(points[candidates], radius)
+        keep_candidates = np.zeros(len(candidates), dtype=bool)
+        for i, neighbors_i in enumerate(neighbors):
+            keep_candidates[i] = not any(keep_candidates[j] for j in neighbors_i if j < i)
+        keep[candidates[keep_candidates]] = True
+        kept_index.add(points[candidates[keep_candidates]])
+    return keep
+
+
+class ArrayBuffer(object):
+    """ Growable array of rows, whose capacity doubles when full. Only the used rows are pickled. """
+
+    def __init__(self, rows=None, initial_capacity=64):
+        self.initial_capacity = initial_capacity
+        self.clear()
+        if rows is not None:
+            self.extend(rows)
+
+    def clear(self):
+        self._buffer = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def data(self):
+        """ Read-only view of the used rows. """
+        if self._buffer is None:
+            return np.zeros((0,))
+        view = self._buffer[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def extend(self, rows):
+        rows = np.asarray(rows)
+        if len(rows) == 0:
+            return
+        if self._buffer is None:
+            # numeric rows are stored at least as float64, so that later float rows are never truncated
+            dtype = np.result_type(rows, np.float64) if rows.dtype.kind in 'iuf' else rows.dtype
+            self._buffer = np.empty((max(self.initial_capacity, len(rows)),) + rows.shape[1:], dtype=dtype)
+        else:
+            self._widen(rows)
+            if self._size + len(rows) > len(self._buffer):
+                capacity = len(self._buffer)
+                while capacity < self._size + len(rows):
+                    capacity *= 2
+                self._reallocate(capacity, self._buffer.dtype)
+        self._buffer[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+
+    def set_rows(self, indices, rows):
+        self._widen(np.asarray(rows))
+        self._buffer[:self._size][indices] = rows
+
+    def _widen(self, rows):
+        """ Promote the buffer to a dtype that can hold the given rows too. """
+        dtype = np.result_type(self._buffer, rows)
+        if dtype != self._buffer.dtype:
+            self._reallocate(len(self._buffer), dtype)
+
+    def _reallocate(self, capacity, dtype):
+        new_buffer = np.empty((capacity,) + self._buffer.shape[1:], dtype=dtype)
+        new_buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = new_buffer
+
+    def __getstate__(self):
+        return dict(initial_capacity=self.initial_capacity, rows=np.array(self.data))
+
+    def __setstate__(self, d):
+        self.__init__(rows=d['rows'], initial_capacity=d['initial_capacity'])
+
+
 class StateCollection(object):
     """ A collection of states, with minimum distance threshold for new states. """
 
     def __init__(self, distance_threshold=None, states_transform = None, idx_lim=None):
         self.distance_threshold = distance_threshold
-        self.state_list = []
+        self._states = ArrayBuffer()
         self.states_transform = states_transform
         self.idx_lim = idx_lim
         if self.states_transform:
-            self.transformed_state_list = []
+            self._transformed_states = ArrayBuffer()
+        self._index = None
 
     @property
     def size(self):
-        return len(self.state_list)
+        return len(self._states)
+
+    @property
+    def state_list(self):
+        return self._states.data
+
+    @property
+    def transformed_state_list(self):
+        return self._transformed_states.data
 
     def empty(self):
-        self.state_list = []
+        self._states.clear()
+        if self.states_transform:
+            self._transformed_states.clear()
+        self._index = None
+
+    @property
+    def index(self):
+        """ Spatial index of the stored states in the space used for the distance threshold, built lazily. """
+        if getattr(self, '_index', None) is None:
+            self._index = StateIndex()
+            if self.states_transform:
+                self._index.add(self.transformed_state_list)
+            elif self.size > 0:
+                self._index.add(self.state_list[:, :self.idx_lim])
+        return self._index
+
+    def __getstate__(self):
+        # the index can be rebuilt from the states, do not store it
+        d = self.__dict__.copy()
+        d['_index'] = None
+        return d
+
+    def __setstate__(self, d):
+        # collections pickled before the array-backed storage hold python lists
+        if 'state_list' in d:
+            d['_states'] = ArrayBuffer(d.pop('state_list'))
+        if 'transformed_state_list' in d:
+            d['_transformed_states'] = ArrayBuffer(d.pop('transformed_state_list'))
+        self.__dict__.update(d)
 
     def sample(self, size, replace=False, replay_noise=0):
-        states = sample_matrix_row(np.array(self.state_list), size, replace)
+        states = sample_matrix_row(self.states, size, replace)
+        if not states.flags.writeable:  # the whole collection was returned, do not hand out the buffer
+            states = np.array(states)
         if replay_noise > 0:
             states += replay_noise * np.random.randn(*states.shape)
         return states
 
     def append(self, states, n_process=None):
+        """
+        Add the states that are further than distance_threshold from the stored ones and from each other.
+        n_process is kept for backwards compatibility: the selection uses the spatial index and is not parallelized.
+        """
         if self.states_transform:
             return self.append_states_transform(states)
         if len(states) > 0:
@@ -51,60 +221,32 @@ class StateCollection(object):
             if self.distance_threshold is not None and self.distance_threshold > 0:
                 states = self._process_states(states)
             logger.log("after processing, we are left with : {}".format(states.shape))
-            if n_process is None:
-                n_process = singleton_pool.n_parallel
-            elif n_process in [-1, 0]:
-                n_process = 1
-            if states.shape[0] >= n_process > 1:
-                states_per_process = states.shape[0] // singleton_pool.n_parallel
-                list_of_states = [states[i * states_per_process: (i+1) * states_per_process, :] for i in range(n_process-1)]
-                list_of_states.append(states[states_per_process * (n_process - 1):, :])
-                states = parallel_map(self._select_states, list_of_states)
-                states = np.concatenate(states)
-            else:
-                states = self._select_states(states)
-            self.state_list.extend(states.tolist())
+            states = self._select_states(states)
+            if self.distance_threshold is not None and self.distance_threshold > 0:
+                self.index.add(states[:, :self.idx_lim])
+            self._states.extend(states)
             return states
 
     def _select_states(self, states):
-        # print('selecting states from shape: ', states.shape)
+        "keep only the states that are at more than dist_threshold from the stored ones"
         selected_states = states
-        selected_states_idx_lim = np.array([state[:self.idx_lim] for state in states])
-        # print('selecting states from shape (after idx_lim of ', self.idx_lim, ': ', selected_states_idx_lim.shape)
-        state_list_idx_lim = np.array([state[:self.idx_lim] for state in self.state_list])
-        # print('the state_list_idx_lim shape: ', np.shape(self.state_list))
         if self.distance_threshold is not None and self.distance_threshold > 0:
-            if len(self.state_list) > 0:
-                dists = scipy.spatial.distance.cdist(state_list_idx_lim, selected_states_idx_lim)
-                indices = np.amin(dists, axis=0) > self.distance_threshold
+            if self.size > 0:
+                indices = np.logical_not(self.index.has_neighbor(states[:, :self.idx_lim], self.distance_threshold))
                 selected_states = selected_states[indices, :]
-        # print('the selected states are: {}'.format(selected_states.shape))
         return selected_states
 
     def _process_states(self, states):
         "keep only the states that are at more than dist_threshold from each other"
         # adding a states transform allows you to maintain full state information while possibly disregarding some dim
         states = np.array(states)
-        results = [states[0]]
-        results_idx_lim = [states[0][:self.idx_lim]]
-        for i, state in enumerate(states[1:]):
-            # print("analyzing state : ", i)
-            if np.amin(scipy.spatial.distance.cdist(results_idx_lim, state.reshape(1, -1)[:self.idx_lim])) > self.distance_threshold:
-                results.append(state)
-                results_idx_lim.append(state[:self.idx_lim])
-        return np.array(results)
+        return states[filter_close_points(states[:, :self.idx_lim], self.distance_threshold)]
 
     def _process_states_transform(self, states, transformed_states):
         "keep only the states that are at more than dist_threshold from each other"
         # adding a states transform allows you to maintain full state information while possibly disregarding some dim
-        results = [states[0]]
-        transformed_results = [transformed_states[0]]
-        for i in range(1, len(states)):
-            # checks if valid in transformed space
-            if np.amin(scipy.spatial.distance.cdist(transformed_results, transformed_states[i].reshape(1, -1))) > self.distance_threshold:
-                results.append(states[i])
-                transformed_results.append(transformed_states[i])
-        return np.array(results), np.array(transformed_results)
+        indices = filter_close_points(transformed_states, self.distance_threshold)
+        return np.array(states)[indices], np.array(transformed_states)[indices]
 
     def append_states_transform(self, states):
         assert self.idx_lim is None, "Can't use state transform and idx_lim with StateCollection!"
@@ -113,15 +255,14 @@ class StateCollection(object):
             transformed_states = self.states_transform(states)
             if self.distance_threshold is not None and self.distance_threshold > 0:
                 states, transformed_states = self._process_states_transform(states, transformed_states)
-                if len(self.state_list) > 0:
-                    print("hi")
-                    dists = scipy.spatial.distance.cdist(self.transformed_state_list, transformed_states)
-                    indices = np.amin(dists, axis=0) > self.distance_threshold
+                if self.size > 0:
+                    indices = np.logical_not(self.index.has_neighbor(transformed_states, self.distance_threshold))
                     states = states[indices, :]
                     transformed_states = transformed_states[indices, :]
-            self.state_list.extend(states)
-            self.transformed_state_list.extend(transformed_states)
-            assert(len(self.state_list) == len(self.transformed_state_list))
+                self.index.add(transformed_states)
+            self._states.extend(states)
+            self._transformed_states.extend(transformed_states)
+            assert(len(self._states) == len(self._transformed_states))
         return states # modifed to return added states
 
     # def append(self, states):
@@ -140,89 +281,127 @@ class StateCollection(object):
 
     @property
     def states(self):
-        return np.array(self.state_list)
+        """ Read-only view of the stored states. """
+        return self.state_list
+
+def state_key(state):
+    """ Hashable key of a state, equal for states with equal values. """
+    return (np.asarray(state, dtype=float).ravel() + 0.).tobytes()  # + 0. maps -0. to 0.
+
 
 class SmartStateCollection(StateCollection):
+    """
+    StateCollection keeping a Q value for each stored state, used to sample the states with the highest (absolute)
+    values. States are mapped to their row of the collection through a hash map of their bytes, and the Q values are
+    stored in arrays aligned with the rows.
+    """
     # should be used same as before, just need to update Q values
     #TODO: update alpha smartly
     def __init__(self, eps = 0.5, alpha = 0.3, abs = True, *args, **kwargs):
         self.eps = eps # percentage of random
         self.alpha = alpha
         self.abs = abs
-        self.q_vals = {} #TODO: smarter way to keep list sorted, maybe priority queue?
-        # use heapq https://stackoverflow.com/questions/7197315/5-maximum-values-in-a-python-dictionary if slow
-        self.prev_vals = {}
+        self._q_vals = ArrayBuffer()
+        self._prev_vals = ArrayBuffer()
+        self._slots = {}
         super(SmartStateCollection, self).__init__(*args, **kwargs)
 
+    @property
+    def q_vals(self):
+        return self._q_vals.data
+
+    @property
+    def prev_vals(self):
+        return self._prev_vals.data
+
+    def empty(self):
+        super(SmartStateCollection, self).empty()
+        self._q_vals.clear()
+        self._prev_vals.clear()
+        self._slots = {}
+
+    def __getstate__(self):
+        d = super(SmartStateCollection, self).__getstate__()
+        del d['_slots']
+        return d
+
+    def __setstate__(self, d):
+        super(SmartStateCollection, self).__setstate__(d)
+        self._slots = {state_key(state): slot for slot, state in enumerate(self.states)}
+
+    def get_slots(self, states):
+        """ Row of each of the given states in the collection, -1 for the ones that are not stored. """
+        return np.array([self._slots.get(state_key(state), -1) for state in states], dtype=int)
+
     def update_starts(self, states, rewards, only_good = True, logger = None):
-        old_states, old_rewards, new_states, new_rewards = [], [], [], []
-        for i in range(len(states)):
-            state = states[i]
-            reward = rewards[i]
-            if only_good:
-                # TODO: set option
-                # intuition is that we don't want states that we already master
-                if reward < 0.02 or reward > 0.98:
-                    continue
-            # check if state shows up
-            if len(self.state_list) > 0 and np.sum(np.all(state == self.state_list, axis = 1)) > 0:
-                old_states.append(state)
-                old_rewards.append(reward)
-            else:
-                new_states.append(state)
-                new_rewards.append(reward)
+        states = np.asarray(states)
+        rewards = np.asarray(rewards).reshape(-1)
+        if only_good:
+            # TODO: set option
+            # intuition is that we don't want states that we already master
+            keep = np.logical_and(rewards >= 0.02, rewards <= 0.98)
+            states, rewards = states[keep], rewards[keep]
+        # check if state shows up
+        slots = self.get_slots(states)
+        is_old = slots >= 0
         if logger is not None:
-            logger.log("Total states: {}  New states: {}".format(len(states), len(new_states)))
-        self.append(new_states, new_rewards)
-        self.update_q(old_states, old_rewards)
+            logger.log("Total states: {}  New states: {}".format(len(states), np.sum(~is_old)))
+        self.append(states[~is_old], rewards[~is_old])
+        self._update_q_slots(slots[is_old], rewards[is_old])
 
     def append(self, states, rewards):
-        zero_index = 0 # check on np.argmax
+        if len(states) == 0:
+            return
+        states = np.asarray(states)
+        rewards = np.asarray(rewards).reshape(-1)
+        first_index = {}
+        for index, state in enumerate(states):
+            first_index.setdefault(state_key(state), index)
+        first_slot = self.size
         added_states = super(SmartStateCollection, self).append(states)
-        for state in added_states:
-            index = np.argmax(np.all(states == state, axis =1)) # should only get one index
-            if index == 0:
-                zero_index += 1
-            reward = rewards[index]
-            self.q_vals[tuple(state)] = self.alpha * reward # TODO: not sure what the initialization should be, is there alpha term?
-            self.prev_vals[tuple(state)] = reward
-        assert (zero_index < 2)
+        added_keys = [state_key(state) for state in added_states]
+        added_rewards = rewards[[first_index[key] for key in added_keys]]
+        for slot, key in enumerate(added_keys, first_slot):
+            self._slots[key] = slot
+        # TODO: not sure what the initialization should be, is there alpha term?
+        self._q_vals.extend(self.alpha * added_rewards)
+        self._prev_vals.extend(added_rewards)
 
     def sample(self, size, replace=False, replay_noise=0):
         size_random_samples = int(size * self.eps)
         size_good_samples = size - size_random_samples
         print("Random starts: {}".format(size_random_samples))
-        states = sample_matrix_row(np.array(self.state_list), size_random_samples, replace)
-        if size_good_samples == 0:
+        states = sample_matrix_row(self.states, size_random_samples, replace)
+        if not states.flags.writeable:
+            states = np.array(states)
+        if size_good_samples == 0 or self.size == 0:
             return states # fully uniform states
-        if self.abs:
-            good_states = sorted(self.q_vals, key= lambda k: abs(self.q_vals[k]), reverse=True)[:size_good_samples]
+        scores = np.abs(self.q_vals) if self.abs else self.q_vals
+        if size_good_samples < self.size:
+            good_slots = np.argpartition(-scores, size_good_samples - 1)[:size_good_samples]
         else:
-            good_states = sorted(self.q_vals, key=self.q_vals.get, reverse=True)[:size_good_samples]
-        good_states = np.array(good_states)
-        return np.concatenate((states, good_states))
+            good_slots = np.arange(self.size)
+        good_slots = good_slots[np.argsort(-scores[good_slots], kind='mergesort')]
+        return np.concatenate((states, self.states[good_slots]))
         # if replay_noise > 0:
         #     states += replay_noise * np.random.randn(*states.shape)
         # return states
 
     def update_q(self, states, rewards):
-        # updated should be true if there are enough samples
-        previous_values = np.array([self.prev_vals[tuple(state)] for state in states])
-        curr_q_values =  np.array([self.q_vals[tuple(state)] for state in states])
-        improvement = rewards - previous_values
-        new_values = self.alpha * improvement + (1 - self.alpha) * curr_q_values
-
-        for i in range(len(states)):
-            # if updated[i]:
-            self.q_vals[tuple(states[i])] = new_values[i]
-            self.prev_vals[tuple(states[i])] = rewards[i]
-
-
-
-
-
-
+        slots = self.get_slots(states)
+        if np.any(slots < 0):
+            missing = np.flatnonzero(slots < 0)[0]
+            raise KeyError("State not in the collection: {}".format(states[missing]))
+        self._update_q_slots(slots, np.asarray(rewards).reshape(-1))
 
+    def _update_q_slots(self, slots, rewards):
+        # updated should be true if there are enough samples
+        if len(slots) == 0:
+            return
+        assert np.all(slots >= 0), "Q values can only be updated for stored states"
+        improvement = rewards - self.prev_vals[slots]
+        self._q_vals.set_rows(slots, self.alpha * improvement + (1 - self.alpha) * self.q_vals[slots])
+        self._prev_vals.set_rows(slots, rewards)
 
 
 def sample_matrix_row(M, size, replace=False):
@@ -2,6 +2,7 @@ from rllab.algos.base import RLAlgorithm
 from rllab.sampler import parallel_sampler
 from rllab.sampler.base import BaseSampler
 import rllab.misc.logger as logger
+from rllab.misc import ext
 import rllab.plotter as plotter
 from rllab.policies.base import Policy
 
@@ -60,6 +61,8 @@ class BatchPolopt(RLAlgorithm):
             whole_paths=True,
             sampler_cls=None,
             sampler_args=None,
+            path_reducer=None,
+            persistent_workers=False,
             **kwargs
     ):
         """
@@ -81,6 +84,12 @@ class BatchPolopt(RLAlgorithm):
         :param positive_adv: Whether to shift the advantages so that they are always positive. When used in
         conjunction with center_adv the advantages will be standardized before shifting.
         :param store_paths: Whether to save all paths data to the snapshot.
+        :param path_reducer: Callable applied to the paths of every iteration. If given, train returns its outputs
+        instead of the raw paths, so that they can be freed after each iteration.
+        :param persistent_workers: Keep the sampler workers populated when train returns, so that train can be called
+        again (e.g. in every outer iteration of a curriculum, after reset_itr and with already_init=True) without
+        compiling the optimization functions nor shipping env and policy to the workers again. Env changes must then
+        go through update_env.
         """
         self.env = env
         self.policy = policy
@@ -98,6 +107,8 @@ class BatchPolopt(RLAlgorithm):
         self.positive_adv = positive_adv
         self.store_paths = store_paths
         self.whole_paths = whole_paths
+        self.path_reducer = path_reducer
+        self.persistent_workers = persistent_workers
         if sampler_cls is None:
             sampler_cls = BatchSampler
         if sampler_args is None:
@@ -113,6 +124,22 @@ class BatchPolopt(RLAlgorithm):
     def shutdown_worker(self):
         self.sampler.shutdown_worker()
 
+    def update_env(self, method_name, *args, **kwargs):
+        """
+        Call a method of env, e.g. update_start_generator, and of the copies of env populated in the sampler workers.
+        """
+        ret = getattr(self.env, method_name)(*args, **kwargs)
+        parallel_sampler.call_env_method(method_name, *args, scope=self.scope, **kwargs)
+        return ret
+
+    def reset_itr(self, n_itr=None, start_itr=0):
+        """
+        Prepare a new call to train on the same algorithm instance.
+        """
+        if n_itr is not None:
+            self.n_itr = n_itr
+        self.current_itr = start_itr
+
     def train(self, already_init=False):
         self.start_worker()
         if not already_init:
@@ -124,13 +151,17 @@ class BatchPolopt(RLAlgorithm):
                 samples_data = self.sampler.process_samples(itr, paths)
                 self.log_diagnostics(paths)
                 self.optimize_policy(itr, samples_data)
+                ext.log_compile_cache_stats()
                 logger.log("saving snapshot...")
                 params = self.get_itr_snapshot(itr, samples_data)
                 self.current_itr = itr + 1
                 params["algo"] = self
                 if self.store_paths:
                     params["paths"] = samples_data["paths"]
-                all_paths.append(paths)
+                if self.path_reducer is not None:
+                    all_paths.append(self.path_reducer(paths))
+                else:
+                    all_paths.append(paths)
                 logger.save_itr_params(itr, params)
                 logger.log("saved")
                 logger.dump_tabular(with_prefix=False)
@@ -140,7 +171,8 @@ class BatchPolopt(RLAlgorithm):
                         input("Plotting evaluation run: Press Enter to "
                                   "continue...")
 
-        self.shutdown_worker()
+        if not getattr(self, 'persistent_workers', False):
+            self.shutdown_worker()
         return all_paths
 
     def log_diagnostics(self, paths):
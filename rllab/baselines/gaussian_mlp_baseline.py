@@ -1,3 +1,5 @@
+from collections import deque
+
 import numpy as np
 
 from rllab.core.serializable import Serializable
@@ -14,12 +16,26 @@ class GaussianMLPBaseline(Baseline, Parameterized, Serializable):
             subsample_factor=1.,
             num_seq_inputs=1,
             regressor_args=None,
+            incremental=False,
+            replay_size=50000,
     ):
+        """
+        :param incremental: Whether to fit the regressor incrementally: the normalization constants are running
+        statistics of all the returns seen, and each fit warm-starts on the paths of the replay window, stopping
+        early on a validation loss.
+        :param replay_size: Maximum number of samples of the most recent paths fitted in incremental mode.
+        """
         Serializable.quick_init(self, locals())
         super(GaussianMLPBaseline, self).__init__(env_spec)
         self._subsample_factor = subsample_factor
+        self._incremental = incremental
+        self._replay_size = replay_size
+        self._replay = deque()
+        self._replay_count = 0
         if regressor_args is None:
             regressor_args = dict()
+        if incremental:
+            regressor_args = dict(regressor_args, incremental=True)
 
         self._regressor = GaussianMLPRegressor(
             input_shape=(env_spec.observation_space.flat_dim * num_seq_inputs,),
@@ -45,8 +61,23 @@ class GaussianMLPBaseline(Baseline, Parameterized, Serializable):
         else:
             observations = np.concatenate([p["observations"] for p in paths])
             returns = np.concatenate([p["returns"] for p in paths])
+        if self._incremental:
+            observations, returns = self._add_to_replay(observations, returns)
         self._regressor.fit(observations, returns.reshape((-1, 1)))
 
+    def _add_to_replay(self, observations, returns):
+        """
+        Update the running normalization with the new samples and add them to the replay window, dropping the oldest
+        batches that don't fit in it (the newest one is always kept).
+        :return: all the observations and returns in the replay window
+        """
+        self._regressor.update_normalization(observations, returns.reshape((-1, 1)), max_count=self._replay_size)
+        self._replay.append((observations, returns))
+        self._replay_count += len(returns)
+        while len(self._replay) > 1 and self._replay_count > self._replay_size:
+            self._replay_count -= len(self._replay.popleft()[1])
+        return np.concatenate([o for o, _ in self._replay]), np.concatenate([r for _, r in self._replay])
+
     @overrides
     def predict(self, path):
         return self._regressor.predict(path["observations"]).flatten()
@@ -1,6 +1,7 @@
 from rllab.baselines.base import Baseline
 from rllab.misc.overrides import overrides
 import numpy as np
+import scipy.linalg
 
 
 class LinearFeatureBaseline(Baseline):
@@ -22,22 +23,68 @@ class LinearFeatureBaseline(Baseline):
         al = np.arange(l).reshape(-1, 1) / 100.0
         return np.concatenate([o, o ** 2, al, al ** 2, al ** 3, np.ones((l, 1))], axis=1)
 
+    def _features_n(self, observations, path_lengths):
+        """
+        Features of the concatenated observations of paths with the given lengths, computed all at once.
+        """
+        o = np.clip(observations, -10, 10)
+        n = len(o)
+        starts = np.cumsum(path_lengths) - path_lengths
+        al = (np.arange(n) - np.repeat(starts, path_lengths)).reshape(-1, 1) / 100.0
+        return np.concatenate([o, o ** 2, al, al ** 2, al ** 3, np.ones((n, 1))], axis=1)
+
+    def _fit_features(self, featmat, returns):
+        # the Gram matrix is computed once, and factorized again only if it needs more regularization
+        gram = featmat.T.dot(featmat)
+        rhs = featmat.T.dot(returns)
+        reg_coeff = self._reg_coeff
+        for _ in range(5):
+            try:
+                coeffs = scipy.linalg.cho_solve(
+                    scipy.linalg.cho_factor(gram + reg_coeff * np.identity(featmat.shape[1])),
+                    rhs
+                )
+            except (np.linalg.LinAlgError, ValueError):
+                coeffs = None
+            if coeffs is not None and not np.any(np.isnan(coeffs)):
+                self._coeffs = coeffs
+                return
+            reg_coeff *= 10
+        # not positive definite even with the largest regularization: least squares, as a last resort
+        self._coeffs = np.linalg.lstsq(gram + reg_coeff / 10 * np.identity(featmat.shape[1]), rhs)[0]
+
     @overrides
     def fit(self, paths):
         featmat = np.concatenate([self._features(path) for path in paths])
         returns = np.concatenate([path["returns"] for path in paths])
-        reg_coeff = self._reg_coeff
-        for _ in range(5):
-            self._coeffs = np.linalg.lstsq(
-                featmat.T.dot(featmat) + reg_coeff * np.identity(featmat.shape[1]),
-                featmat.T.dot(returns)
-            )[0]
-            if not np.any(np.isnan(self._coeffs)):
-                break
-            reg_coeff *= 10
+        self._fit_features(featmat, returns)
+
+    def fit_with_samples(self, paths, samples_data):
+        """
+        Same as fit, but reusing the observations and returns already concatenated in samples_data when they are not
+        padded per path (non-recurrent policies).
+        """
+        if "valids" in samples_data:
+            return self.fit(paths)
+        path_lengths = np.array([len(path["rewards"]) for path in paths])
+        featmat = self._features_n(samples_data["observations"], path_lengths)
+        self._fit_features(featmat, samples_data["returns"])
 
     @overrides
     def predict(self, path):
         if self._coeffs is None:
             return np.zeros(len(path["rewards"]))
         return self._features(path).dot(self._coeffs)
+
+    def predict_n(self, paths):
+        """
+        Predictions for all the paths, computed on their concatenated features and split back per path.
+        """
+        path_lengths = np.array([len(path["rewards"]) for path in paths])
+        if self._coeffs is None:
+            return [np.zeros(l) for l in path_lengths]
+        if len(paths) == 0:
+            return []
+        observations = np.concatenate([path["observations"] for path in paths])
+        predictions = self._features_n(observations, path_lengths).dot(self._coeffs)
+        return np.split(predictions, np.cumsum(path_lengths)[:-1])
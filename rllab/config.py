@@ -73,6 +73,15 @@ MUJOCO_KEY_PATH = osp.expanduser("~/.mujoco")
 
 ENV = {}
 
+# directory where the compiled theano functions are cached across processes (see rllab.misc.ext.compile_function),
+# e.g. osp.expanduser("~/.rllab/compile_cache"). The entries include the values of the shared variables and are never
+# evicted, so the cache is disabled (None) by default
+COMPILE_CACHE_DIR = None
+
+# memory budget, in bytes, of the functions evaluated in automatically sized slices (num_slices='auto' in the
+# optimizers, see rllab.misc.ext.AutoSlices)
+SLICE_MEMORY_BUDGET = 2 * 1024 ** 3
+
 EBS_OPTIMIZED = True
 
 if osp.exists(osp.join(osp.dirname(__file__), "config_personal.py")):
@@ -80,6 +80,20 @@ class Env(object):
         """
         pass
 
+    def vectorize(self, n_envs):
+        """
+        Return a batched version of this environment that simulates n_envs copies of it with array operations.
+        Input
+        -----
+        n_envs : number of copies of the environment
+        Outputs
+        -------
+        an object with an n_envs attribute and the methods
+        reset(indices, **kwargs) -> observations of the reset copies
+        step(actions, indices=None) -> (observations, rewards, dones, infos), all of them arrays over the stepped copies
+        """
+        raise NotImplementedError
+
 
 _Step = collections.namedtuple("Step", ["observation", "reward", "done", "info"])
 
@@ -8,7 +8,8 @@ from rllab import spaces
 from rllab.envs.base import Step
 from rllab.envs.proxy_env import ProxyEnv
 from rllab.envs.mujoco.maze.maze_env_utils import construct_maze
-from rllab.envs.mujoco.maze.maze_env_utils import ray_segment_intersect, point_distance
+from rllab.envs.mujoco.maze.maze_env_utils import construct_segments, sensor_readings, construct_occupancy, \
+    in_cells
 from rllab.envs.mujoco.mujoco_env import MODEL_DIR, BIG
 from rllab.core.serializable import Serializable
 from rllab.misc.overrides import overrides
@@ -120,6 +121,7 @@ class MazeEnv(ProxyEnv, Serializable):
 
         self._goal_range = self._find_goal_range()
         self._cached_segments = None
+        self._cached_occupancy = None
 
         inner_env = model_cls(*args, file_path=file_path, **kwargs)  # file to the robot specifications
         ProxyEnv.__init__(self, inner_env)  # here is where the robot env will be initialized
@@ -129,70 +131,24 @@ class MazeEnv(ProxyEnv, Serializable):
         # environment
         robot_x, robot_y = self.wrapped_env.get_body_com("torso")[:2]
         ori = self.get_ori()
-
-        structure = self.MAZE_STRUCTURE
-        size_scaling = self.MAZE_SIZE_SCALING
-
-        segments = []
-        # compute the distance of all segments
-
-        # Get all line segments of the goal and the obstacles
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 1 or structure[i][j] == 'g':
-                    cx = j * size_scaling - self._init_torso_x
-                    cy = i * size_scaling - self._init_torso_y
-                    x1 = cx - 0.5 * size_scaling
-                    x2 = cx + 0.5 * size_scaling
-                    y1 = cy - 0.5 * size_scaling
-                    y2 = cy + 0.5 * size_scaling
-                    struct_segments = [
-                        ((x1, y1), (x2, y1)),
-                        ((x2, y1), (x2, y2)),
-                        ((x2, y2), (x1, y2)),
-                        ((x1, y2), (x1, y1)),
-                    ]
-                    for seg in struct_segments:
-                        segments.append(dict(
-                            segment=seg,
-                            type=structure[i][j],
-                        ))
-
-        wall_readings = np.zeros(self._n_bins)
-        goal_readings = np.zeros(self._n_bins)
-
-        for ray_idx in range(self._n_bins):
-            ray_ori = ori - self._sensor_span * 0.5 + 1.0 * (2 * ray_idx + 1) / (2 * self._n_bins) * self._sensor_span
-            ray_segments = []
-            for seg in segments:
-                p = ray_segment_intersect(ray=((robot_x, robot_y), ray_ori), segment=seg["segment"])
-                if p is not None:
-                    ray_segments.append(dict(
-                        segment=seg["segment"],
-                        type=seg["type"],
-                        ray_ori=ray_ori,
-                        distance=point_distance(p, (robot_x, robot_y)),
-                    ))
-            if len(ray_segments) > 0:
-                first_seg = sorted(ray_segments, key=lambda x: x["distance"])[0]
-                # print first_seg
-                if first_seg["type"] == 1:
-                    # Wall -> add to wall readings
-                    if first_seg["distance"] <= self._sensor_range:
-                        wall_readings[ray_idx] = (self._sensor_range - first_seg["distance"]) / self._sensor_range
-                elif first_seg["type"] == 'g':
-                    # Goal -> add to goal readings
-                    if first_seg["distance"] <= self._sensor_range:
-                        goal_readings[ray_idx] = (self._sensor_range - first_seg["distance"]) / self._sensor_range
-                else:
-                    assert False
-
+        segments, is_goal = self._get_segments()
+        ray_oris = ori - self._sensor_span * 0.5 + \
+            (2 * np.arange(self._n_bins) + 1) / (2 * self._n_bins) * self._sensor_span
+        wall_readings, goal_readings = sensor_readings((robot_x, robot_y), ray_oris, segments, is_goal,
+                                                       self._sensor_range)
         obs = np.concatenate([
             wall_readings,
             goal_readings
         ])
         return obs
 
+    def _get_segments(self):
+        # the maze is fixed after __init__, so its segments are only computed once
+        if self._cached_segments is None:
+            self._cached_segments = construct_segments(self.MAZE_STRUCTURE, self.MAZE_SIZE_SCALING,
+                                                       self._init_torso_x, self._init_torso_y)
+        return self._cached_segments
+
     def get_current_robot_obs(self):
         return self.wrapped_env.get_current_obs()
 
@@ -261,20 +217,19 @@ class MazeEnv(ProxyEnv, Serializable):
                     maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
                     return minx, maxx, miny, maxy
 
+    def _get_occupancy(self):
+        # boolean grids of the walls and of the empty cells of the maze, computed once
+        if self._cached_occupancy is None:
+            self._cached_occupancy = construct_occupancy(self.MAZE_STRUCTURE)
+        return self._cached_occupancy
+
     def _is_in_collision(self, pos):
-        x, y = pos
-        structure = self.MAZE_STRUCTURE
-        size_scaling = self.MAZE_SIZE_SCALING
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 1:
-                    minx = j * size_scaling - size_scaling * 0.5 - self._init_torso_x
-                    maxx = j * size_scaling + size_scaling * 0.5 - self._init_torso_x
-                    miny = i * size_scaling - size_scaling * 0.5 - self._init_torso_y
-                    maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
-                    if minx <= x <= maxx and miny <= y <= maxy:
-                        return True
-        return False
+        return bool(self.is_in_collision_n(np.reshape(pos, (1, 2)))[0])
+
+    def is_in_collision_n(self, points):
+        """ For each x, y point, whether it is inside (or on the boundary of) a wall block """
+        walls, _ = self._get_occupancy()
+        return in_cells(points, walls, self.MAZE_SIZE_SCALING, self._init_torso_x, self._init_torso_y, closed=True)
 
     def step(self, action):
         if self.MANUAL_COLLISION:
@@ -90,6 +90,127 @@ def ray_segment_intersect(ray, segment):
     return None
 
 
+def ray_segments_intersect(origin, ray_oris, segments):
+    """
+    Vectorized ray_segment_intersect over all the pairs of rays and segments, for rays sharing the same origin
+    :param origin: (x, y) from where all the rays are cast
+    :param ray_oris: array with the direction theta of each ray
+    :param segments: array of shape (n_segments, 2, 2) with the end points of each segment
+    :return: array of shape (n_rays, n_segments) with the distance from origin to each intersection, inf if there is none
+    """
+    x1, y1 = origin
+    ray_oris = np.asarray(ray_oris, dtype=float)[:, None]
+    # same operations as line_intersect, with pt2 one unit away from pt1 along the ray
+    dx1 = (x1 + np.cos(ray_oris)) - x1
+    dy1 = (y1 + np.sin(ray_oris)) - y1
+    x, y = segments[:, 0, 0], segments[:, 0, 1]
+    dx = segments[:, 1, 0] - x
+    dy = segments[:, 1, 1] - y
+    det = -dx1 * dy + dy1 * dx
+    valid = np.abs(det) >= 0.00000001
+    det_inv = 1.0 / np.where(valid, det, 1.)
+    r = det_inv * (-dy * (x - x1) + dx * (y - y1))
+    s = det_inv * (-dy1 * (x - x1) + dx1 * (y - y1))
+    xi = (x1 + r * dx1 + x + s * dx) / 2.0
+    yi = (y1 + r * dy1 + y + s * dy) / 2.0
+    distances = np.sqrt((xi - x1) ** 2 + (yi - y1) ** 2)
+    return np.where(valid & (r >= 0) & (0 <= s) & (s <= 1), distances, np.inf)
+
+
+def construct_segments(structure, size_scaling, init_torso_x, init_torso_y):
+    """
+    Get all line segments of the goal and the obstacles of the maze
+    :return: segments, array of shape (n_segments, 2, 2) with the end points of each segment, and is_goal, boolean
+    array that is True for the segments of the goal and False for the ones of the walls
+    """
+    segments = []
+    is_goal = []
+    for i in range(len(structure)):
+        for j in range(len(structure[0])):
+            if structure[i][j] == 1 or structure[i][j] == 'g':
+                cx = j * size_scaling - init_torso_x
+                cy = i * size_scaling - init_torso_y
+                x1 = cx - 0.5 * size_scaling
+                x2 = cx + 0.5 * size_scaling
+                y1 = cy - 0.5 * size_scaling
+                y2 = cy + 0.5 * size_scaling
+                segments.extend([
+                    ((x1, y1), (x2, y1)),
+                    ((x2, y1), (x2, y2)),
+                    ((x2, y2), (x1, y2)),
+                    ((x1, y2), (x1, y1)),
+                ])
+                is_goal.extend([structure[i][j] == 'g'] * 4)
+    return np.array(segments, dtype=float).reshape(-1, 2, 2), np.array(is_goal, dtype=bool)
+
+
+def sensor_readings(origin, ray_oris, segments, is_goal, sensor_range):
+    """
+    Readings of the rays cast from origin, given by the closest segment each of them hits: (sensor_range - distance) /
+    sensor_range if it is within sensor_range, 0 otherwise
+    :return: wall_readings and goal_readings, with one entry per ray
+    """
+    wall_readings = np.zeros(len(ray_oris))
+    goal_readings = np.zeros(len(ray_oris))
+    if len(segments) == 0:
+        return wall_readings, goal_readings
+    distances = ray_segments_intersect(origin, ray_oris, segments)
+    first_seg = np.argmin(distances, axis=1)
+    first_distances = distances[np.arange(len(ray_oris)), first_seg]
+    in_range = first_distances <= sensor_range
+    readings = (sensor_range - first_distances[in_range]) / sensor_range
+    goal_hit = is_goal[first_seg[in_range]]
+    wall_readings[np.flatnonzero(in_range)[~goal_hit]] = readings[~goal_hit]
+    goal_readings[np.flatnonzero(in_range)[goal_hit]] = readings[goal_hit]
+    return wall_readings, goal_readings
+
+
+def construct_occupancy(structure):
+    """
+    :return: walls and empty, boolean grids with the shape of structure that are True for the cells that are walls
+    (1) and the ones that are free ('r', 'g' or 0) respectively
+    """
+    walls = np.array([[cell == 1 for cell in row] for row in structure], dtype=bool)
+    empty = np.array([[cell == 'r' or cell == 'g' or cell == 0 for cell in row] for row in structure], dtype=bool)
+    return walls, empty
+
+
+def in_cells(points, grid, size_scaling, init_torso_x, init_torso_y, closed=True):
+    """
+    Check for each point if it lies in one of the cells of grid that are True. Only the 3x3 cells around the one the
+    point falls in are checked, with the same bounds as looping over the whole maze.
+    :param points: array of shape (n_points, 2) with the x, y coordinates (relative to the initial torso position)
+    :param closed: if True the boundary of a cell belongs to it (as for collisions), otherwise only its interior does
+    :return: boolean array with one entry per point
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+    finite = np.isfinite(x) & np.isfinite(y)
+    x_c = np.where(finite, x, 0.)
+    y_c = np.where(finite, y, 0.)
+    j_c = np.floor((x_c + init_torso_x) / size_scaling + 0.5).astype(int)
+    i_c = np.floor((y_c + init_torso_y) / size_scaling + 0.5).astype(int)
+    n_rows, n_cols = grid.shape
+    result = np.zeros(len(points), dtype=bool)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            i = i_c + di
+            j = j_c + dj
+            candidate = finite & (0 <= i) & (i < n_rows) & (0 <= j) & (j < n_cols)
+            candidate[candidate] = grid[i[candidate], j[candidate]]
+            if closed:
+                minx = j * size_scaling - size_scaling * 0.5 - init_torso_x
+                maxx = j * size_scaling + size_scaling * 0.5 - init_torso_x
+                miny = i * size_scaling - size_scaling * 0.5 - init_torso_y
+                maxy = i * size_scaling + size_scaling * 0.5 - init_torso_y
+                inside = (minx <= x) & (x <= maxx) & (miny <= y) & (y <= maxy)
+            else:
+                inside = (np.abs(x - (j * size_scaling - init_torso_x)) < size_scaling / 2) & \
+                         (np.abs(y - (i * size_scaling - init_torso_y)) < size_scaling / 2)
+            result |= candidate & inside
+    return result
+
+
 def point_distance(p1, p2):
     x1, y1 = p1
     x2, y2 = p2
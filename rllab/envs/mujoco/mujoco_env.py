@@ -146,7 +146,7 @@ class MujocoEnv(Env):
     def reset(self, init_state=None, *args, **kwargs):
         self.reset_mujoco(init_state)
         self.model.forward()
-        self.current_com = self.model.data.com_subtree[0]
+        self.current_com = self.model.data.views.com_subtree[0].copy()
         self.dcom = np.zeros_like(self.current_com)
         # print("outside mujoco reset: ", self.model.data.qpos, self.model.data.qvel, self.model.data.qacc, self.model.data.ctrl)
         return self.get_current_obs()
@@ -154,42 +154,51 @@ class MujocoEnv(Env):
     def get_current_obs(self):
         return self._get_full_obs()
 
-    def _get_full_obs(self):
-        data = self.model.data
-        cdists = np.copy(self.model.geom_margin).flat
+    def _get_full_obs(self, out=None):
+        """
+        :param out: optional preallocated vector (e.g. a row of a batch of observations) to write the observation into
+        """
+        data = self.model.data.views
+        cdists = np.copy(self.model.views.geom_margin).reshape(-1)
         for c in self.model.data.contact:
             cdists[c.geom2] = min(cdists[c.geom2], c.dist)
-        obs = np.concatenate([
-            data.qpos.flat,
-            data.qvel.flat,
-            # data.cdof.flat,
-            data.cinert.flat,
-            data.cvel.flat,
-            # data.cacc.flat,
-            data.qfrc_actuator.flat,
-            data.cfrc_ext.flat,
-            data.qfrc_constraint.flat,
+        parts = [
+            data.qpos,
+            data.qvel,
+            # data.cdof,
+            data.cinert,
+            data.cvel,
+            # data.cacc,
+            data.qfrc_actuator,
+            data.cfrc_ext,
+            data.qfrc_constraint,
             cdists,
-            # data.qfrc_bias.flat,
-            # data.qfrc_passive.flat,
-            self.dcom.flat,
-        ])
-        return obs
+            # data.qfrc_bias,
+            # data.qfrc_passive,
+            self.dcom,
+        ]
+        if out is None:
+            out = np.empty(sum(part.size for part in parts))
+        start = 0
+        for part in parts:
+            out[start:start + part.size] = part.reshape(-1)
+            start += part.size
+        return out
 
     @property
     def _state(self):
         return np.concatenate([
-            self.model.data.qpos.flat,
-            self.model.data.qvel.flat
+            self.model.data.views.qpos.flat,
+            self.model.data.views.qvel.flat
         ])
 
     @property
     def _full_state(self):
         return np.concatenate([
-            self.model.data.qpos,
-            self.model.data.qvel,
-            self.model.data.qacc,
-            self.model.data.ctrl,
+            self.model.data.views.qpos,
+            self.model.data.views.qvel,
+            self.model.data.views.qacc,
+            self.model.data.views.ctrl,
         ]).ravel()
 
     def inject_action_noise(self, action):
@@ -206,7 +215,7 @@ class MujocoEnv(Env):
         for _ in range(self.frame_skip):
             self.model.step()
         self.model.forward()
-        new_com = self.model.data.com_subtree[0]
+        new_com = self.model.data.views.com_subtree[0].copy()
         self.dcom = new_com - self.current_com
         self.current_com = new_com
 
@@ -267,11 +276,11 @@ class MujocoEnv(Env):
 
     def get_body_xmat(self, body_name):
         idx = self.model.body_names.index(body_name)
-        return self.model.data.xmat[idx].reshape((3, 3))
+        return self.model.data.views.xmat[idx].reshape((3, 3)).copy()
 
     def get_body_com(self, body_name):
         idx = self.model.body_names.index(body_name)
-        return self.model.data.com_subtree[idx]
+        return self.model.data.views.com_subtree[idx].copy()
 
     def get_body_comvel(self, body_name):
         idx = self.model.body_names.index(body_name)
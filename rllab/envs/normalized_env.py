@@ -100,6 +100,42 @@ class NormalizedEnv(ProxyEnv, Serializable):
     def __str__(self):
         return "Normalized: %s" % self._wrapped_env
 
+    @overrides
+    def vectorize(self, n_envs):
+        if self._normalize_obs or self._normalize_reward:
+            # the running estimates are updated sequentially, one step at a time
+            raise NotImplementedError
+        return NormalizedEnvBatch(self, self._wrapped_env.vectorize(n_envs))
+
+
+class NormalizedEnvBatch(object):
+    """
+    Batched version of a NormalizedEnv without observation or reward normalization: it rescales the actions of all the
+    stepped copies at once before passing them to the batched wrapped env.
+    """
+
+    def __init__(self, env, wrapped_batch):
+        self.wrapped_batch = wrapped_batch
+        self.n_envs = wrapped_batch.n_envs
+        self._scale_reward = env._scale_reward
+        self._clip = env._clip
+        if isinstance(env.wrapped_env.action_space, Box):
+            self._action_bounds = env.wrapped_env.action_space.bounds
+        else:
+            self._action_bounds = None
+
+    def reset(self, indices, **kwargs):
+        return self.wrapped_batch.reset(indices, **kwargs)
+
+    def step(self, actions, indices=None):
+        if self._action_bounds is not None:
+            lb, ub = self._action_bounds
+            actions = lb + (np.asarray(actions) + 1.) * 0.5 * (ub - lb)
+            if self._clip:
+                actions = np.clip(actions, lb, ub)
+        next_obs, rewards, dones, infos = self.wrapped_batch.step(actions, indices)
+        return next_obs, rewards * self._scale_reward, dones, infos
+
     # def log_diagnostics(self, paths):
     #     print "Obs mean:", self._obs_mean
     #     print "Obs std:", np.sqrt(self._obs_var)
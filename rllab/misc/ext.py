@@ -133,20 +133,160 @@ def compile_function(inputs=None, outputs=None, updates=None, givens=None, log_n
     if log_name:
         msg = Message("Compiling function %s" % log_name)
         msg.__enter__()
-    ret = theano.function(
-        inputs=inputs,
-        outputs=outputs,
-        updates=updates,
-        givens=givens,
-        on_unused_input='ignore',
-        allow_input_downcast=True,
-        **kwargs
-    )
+    cache_file = _compile_cache_file(inputs, outputs, updates, givens, kwargs)
+    ret = _load_compiled_function(cache_file, inputs, outputs, updates, givens)
+    if cache_file is not None:
+        compile_cache_stats['hits' if ret is not None else 'misses'] += 1
+    if ret is None:
+        ret = theano.function(
+            inputs=inputs,
+            outputs=outputs,
+            updates=updates,
+            givens=givens,
+            on_unused_input='ignore',
+            allow_input_downcast=True,
+            **kwargs
+        )
+        _save_compiled_function(cache_file, ret, inputs, outputs, updates, givens)
     if log_name:
         msg.__exit__(None, None, None)
     return ret
 
 
+# hits and misses of the on-disk cache of compile_function in this process
+compile_cache_stats = dict(hits=0, misses=0)
+
+
+def log_compile_cache_stats():
+    from rllab.misc import logger
+    logger.record_tabular('CompileCacheHits', compile_cache_stats['hits'])
+    logger.record_tabular('CompileCacheMisses', compile_cache_stats['misses'])
+
+
+def _as_list(x):
+    if x is None:
+        return []
+    if isinstance(x, (list, tuple)):
+        return list(x)
+    return [x]
+
+
+def _as_pairs(x):
+    if x is None:
+        return []
+    if isinstance(x, dict):
+        return list(x.items())
+    return list(x)
+
+
+def _graph_variables(inputs, outputs, updates, givens):
+    update_pairs = _as_pairs(updates)
+    given_pairs = _as_pairs(givens)
+    return _as_list(inputs) + _as_list(outputs) + [k for k, _ in update_pairs] + [v for _, v in update_pairs] + \
+        [k for k, _ in given_pairs] + [v for _, v in given_pairs]
+
+
+def _graph_shared_variables(inputs, outputs, updates, givens):
+    """
+    Shared variables of the graph, in the (deterministic) order in which they are found when traversing it.
+    """
+    from theano.compile import SharedVariable
+    from theano.gof import graph
+    return [v for v in graph.inputs(_graph_variables(inputs, outputs, updates, givens))
+            if isinstance(v, SharedVariable)]
+
+
+def _compile_cache_file(inputs, outputs, updates, givens, kwargs):
+    """
+    Path of the cache entry of the function compiled from the given graph, or None if the cache is disabled or the
+    compilation options can't be hashed reliably. The key covers the structure of the graph (including the types of
+    the inputs and the content of the constants), floatX and the theano version.
+    """
+    from rllab import config
+    cache_dir = getattr(config, "COMPILE_CACHE_DIR", None)
+    if cache_dir is None:
+        return None
+    if not all(isinstance(v, (str, int, float, bool, type(None))) for v in kwargs.values()):
+        return None
+    import hashlib
+    import theano
+    from theano.gof import graph
+    all_vars = _graph_variables(inputs, outputs, updates, givens)
+    try:
+        graph_str = theano.printing.debugprint(all_vars, file='str', print_type=True)
+    except Exception as e:
+        _log_compile_cache_error("hashing the graph", e)
+        return None
+    sha = hashlib.sha1()
+    sha.update(graph_str.encode())
+    for var in graph.ancestors(all_vars):
+        if isinstance(var, graph.Constant):
+            sha.update(np.asarray(var.data).tobytes())
+    sha.update(repr((
+        len(_as_list(inputs)), isinstance(outputs, (list, tuple)), len(_as_list(outputs)),
+        len(_as_pairs(updates)), len(_as_pairs(givens)), sorted(kwargs.items()),
+        theano.config.floatX, theano.config.device, theano.config.mode, theano.config.optimizer,
+        theano.__version__, sys.version_info[:2],
+    )).encode())
+    cache_dir = Path(cache_dir).expanduser()
+    cache_dir.mkdir_p()
+    return cache_dir / ('%s.pkl' % sha.hexdigest())
+
+
+def _load_compiled_function(cache_file, inputs, outputs, updates, givens):
+    """
+    Load the function stored in cache_file and rebind it to the shared variables of the current graph, so that it
+    reads and updates the live parameters instead of the ones that were pickled with it. Return None on a miss.
+    """
+    if cache_file is None or not cache_file.exists():
+        return None
+    try:
+        with open(cache_file, "rb") as f:
+            shared_positions, fn = pickle.load(f)
+        current_shared = _graph_shared_variables(inputs, outputs, updates, givens)
+        loaded_shared = fn.get_shared()
+        swap = dict()
+        for loaded, pos in zip(loaded_shared, shared_positions):
+            if loaded.type != current_shared[pos].type:
+                raise ValueError("Shared variable type mismatch")
+            swap[loaded] = current_shared[pos]
+        if len(swap) != len(loaded_shared):
+            raise ValueError("Shared variables mismatch")
+        if len(swap) > 0:
+            fn = fn.copy(swap=swap)
+    except Exception as e:
+        _log_compile_cache_error("loading %s, compiling the function instead" % cache_file, e)
+        return None
+    return fn
+
+
+def _save_compiled_function(cache_file, fn, inputs, outputs, updates, givens):
+    if cache_file is None:
+        return
+    positions = {id(v): pos for pos, v in enumerate(_graph_shared_variables(inputs, outputs, updates, givens))}
+    shared_positions = [positions.get(id(v)) for v in fn.get_shared()]
+    if None in shared_positions:
+        # some shared variable of the function can't be located in the graph when reloading it
+        return
+    import os
+    import tempfile
+    fd, tmp_file = tempfile.mkstemp(dir=cache_file.dirname(), suffix='.tmp')
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((shared_positions, fn), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # atomic, so that concurrent workers never read a partially written entry
+        os.rename(tmp_file, cache_file)
+    except Exception as e:
+        _log_compile_cache_error("saving %s" % cache_file, e)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _log_compile_cache_error(action, e):
+    from rllab.misc import logger
+    logger.log("Compile cache: failed %s (%s: %s)" % (action, type(e).__name__, e))
+
+
 def new_tensor(name, ndim, dtype):
     import theano.tensor as TT
     return TT.TensorType(dtype, (False,) * ndim)(name)
@@ -358,6 +498,106 @@ def unflatten_tensor_variables(flatarr, shapes, symb_arrs):
     return arrs
 
 
+class AutoSlices(object):
+    """
+    Slicing of the inputs of sliced_fun chosen from a memory budget instead of a fixed number of slices: each slice
+    holds as many samples as fit in memory_budget bytes, counting the bytes of one sample of the inputs plus
+    per_sample_bytes for the activations computed from it.
+    """
+
+    def __init__(self, memory_budget=None, per_sample_bytes=0):
+        """
+        :param memory_budget: bytes available for evaluating one slice, config.SLICE_MEMORY_BUDGET by default
+        :param per_sample_bytes: bytes taken by the intermediate values computed for one sample
+        """
+        if memory_budget is None:
+            from rllab import config
+            memory_budget = config.SLICE_MEMORY_BUDGET
+        self.memory_budget = memory_budget
+        self.per_sample_bytes = per_sample_bytes
+        self._sliced_funs = dict()
+
+    def sample_bytes(self, sliced_inputs):
+        return self.per_sample_bytes + sum(np.asarray(v[:1]).nbytes for v in sliced_inputs)
+
+    def slice_size(self, sliced_inputs):
+        return max(1, int(self.memory_budget // max(1, self.sample_bytes(sliced_inputs))))
+
+    def sliced(self, f):
+        """
+        Sliced version of f, built once per function so that its output accumulators are reused across calls.
+        """
+        if f not in self._sliced_funs:
+            self._sliced_funs[f] = _auto_sliced_fun(f, self)
+        return self._sliced_funs[f]
+
+
+def activation_bytes_per_sample(target, n_copies=4):
+    """
+    Rough estimate of the bytes of the activations computed by the network of target for one sample: the width of
+    the output of every weight matrix, times n_copies to account for the pre-activations and the backward (or R-op)
+    pass.
+    """
+    n_units = sum(shape[-1] for shape in target.get_param_shapes(trainable=True) if len(shape) >= 2)
+    itemsize = max(np.dtype(dtype).itemsize for dtype in target.get_param_dtypes(trainable=True))
+    return n_copies * n_units * itemsize
+
+
+def resolve_slices(n_slices, target, memory_budget=None):
+    """
+    Return n_slices unchanged, or if it is 'auto' the AutoSlices that fit the activations of target in memory_budget.
+    """
+    if n_slices == 'auto':
+        return AutoSlices(memory_budget, activation_bytes_per_sample(target))
+    return n_slices
+
+
+def _auto_sliced_fun(f, slices):
+    from rllab.misc import logger
+    # accumulators of the outputs, reused across the calls as long as the output shapes don't change
+    accumulators = []
+    last_slicing = [None]
+
+    def sliced_f(sliced_inputs, non_sliced_inputs=None):
+        if non_sliced_inputs is None:
+            non_sliced_inputs = []
+        non_sliced_inputs = list(non_sliced_inputs)
+        n_paths = len(sliced_inputs[0])
+        slice_size = min(max(1, n_paths), slices.slice_size(sliced_inputs))
+        slicing = (n_paths, slice_size)
+        if slicing != last_slicing[0]:
+            last_slicing[0] = slicing
+            logger.log("%s: %d samples in %d slices of %d, estimated peak memory %.1f MB" % (
+                getattr(f, "name", None) or "sliced function", n_paths, -(-n_paths // slice_size), slice_size,
+                slice_size * slices.sample_bytes(sliced_inputs) / 1024. ** 2))
+        slice_ret_vals = None
+        for i, start in enumerate(range(0, n_paths, slice_size)):
+            inputs_slice = [v[start:start + slice_size] for v in sliced_inputs]
+            slice_ret_vals = f(*(inputs_slice + non_sliced_inputs))
+            if not isinstance(slice_ret_vals, (tuple, list)):
+                slice_ret_vals_as_list = [slice_ret_vals]
+            else:
+                slice_ret_vals_as_list = slice_ret_vals
+            n_slice = len(inputs_slice[0])
+            if i == 0:
+                values = [np.asarray(v) for v in slice_ret_vals_as_list]
+                if [(acc.shape, acc.dtype) for acc in accumulators] != [(v.shape, v.dtype) for v in values]:
+                    accumulators[:] = [np.empty_like(v) for v in values]
+                for acc, v in zip(accumulators, values):
+                    np.multiply(v, n_slice, out=acc, casting='unsafe')
+            else:
+                for acc, v in zip(accumulators, slice_ret_vals_as_list):
+                    acc += np.multiply(v, n_slice)
+        ret_vals = [acc / n_paths for acc in accumulators]
+        if not isinstance(slice_ret_vals, (tuple, list)):
+            ret_vals = ret_vals[0]
+        elif isinstance(slice_ret_vals, tuple):
+            ret_vals = tuple(ret_vals)
+        return ret_vals
+
+    return sliced_f
+
+
 """
 Devide function f's inputs into several slices. Evaluate f on those slices, and then average the result. It is useful when memory is not enough to process all data at once.
 Assume:
@@ -367,6 +607,9 @@ Assume:
 
 
 def sliced_fun(f, n_slices):
+    if isinstance(n_slices, AutoSlices):
+        return n_slices.sliced(f)
+
     def sliced_f(sliced_inputs, non_sliced_inputs=None):
         if non_sliced_inputs is None:
             non_sliced_inputs = []
@@ -15,6 +15,14 @@ import joblib
 import json
 import pickle
 import base64
+import atexit
+import copyreg
+import io
+import stat
+import tempfile
+import threading
+import time
+import weakref
 
 _prefixes = []
 _prefix_str = ''
@@ -35,6 +43,8 @@ _tabular_header_written = set()
 _snapshot_dir = None
 _snapshot_mode = 'all'
 _snapshot_gap = 1
+_snapshot_async = False
+_snapshot_writer = None
 
 _log_tabular_only = False
 _header_printed = False
@@ -162,6 +172,18 @@ def set_snapshot_gap(gap):
     _snapshot_gap = gap
 
 
+def get_snapshot_async():
+    return _snapshot_async
+
+
+def set_snapshot_async(snapshot_async):
+    """
+    If True, save_itr_params hands the serialized snapshots to a background thread that writes them to disk
+    """
+    global _snapshot_async
+    _snapshot_async = snapshot_async
+
+
 def set_log_tabular_only(log_tabular_only):
     global _log_tabular_only
     _log_tabular_only = log_tabular_only
@@ -333,13 +355,188 @@ def save_itr_params(itr, params, use_cloudpickle=True, pkl_prefix=''):
         else:
             raise NotImplementedError
         if use_cloudpickle:
-            import cloudpickle
-            with open(file_name, 'wb') as f:
-                cloudpickle.dump(params, f, protocol=3)
+            start_time = time.time()
+            data = _dumps_snapshot(params)
+            record_tabular('SnapshotSerializeTime', time.time() - start_time)
+            if _snapshot_async:
+                writer = _get_snapshot_writer()
+                # the write of this snapshot is still ongoing: report the latency of the previous one
+                if writer.last_write_time is not None:
+                    record_tabular('SnapshotWriteTime', writer.last_write_time)
+                writer.submit(file_name, data)
+            else:
+                start_time = time.time()
+                _write_atomic(file_name, data)
+                record_tabular('SnapshotWriteTime', time.time() - start_time)
         else:
             joblib.dump(params, file_name, compress=3)
 
 
+def flush_snapshots():
+    """
+    Wait until all the snapshots handed to the background writer are on disk
+    """
+    if _snapshot_writer is not None:
+        _snapshot_writer.flush()
+
+
+def _get_snapshot_writer():
+    global _snapshot_writer
+    if _snapshot_writer is None:
+        _snapshot_writer = SnapshotWriter()
+        atexit.register(flush_snapshots)
+    return _snapshot_writer
+
+
+# the umask can only be read by setting it, which is not safe to do from the snapshot writer thread
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def _write_atomic(file_name, data):
+    # write to a temporary file in the same directory and rename it, so that file_name is never left half written
+    fd, tmp_file_name = tempfile.mkstemp(dir=osp.dirname(file_name), prefix=osp.basename(file_name), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates the file readable by its owner only, give it the permissions a plain open would have
+        if osp.exists(file_name):
+            os.chmod(tmp_file_name, stat.S_IMODE(os.stat(file_name).st_mode))
+        else:
+            os.chmod(tmp_file_name, 0o666 & ~_umask)
+        os.rename(tmp_file_name, file_name)
+    except Exception:
+        if osp.exists(tmp_file_name):
+            os.remove(tmp_file_name)
+        raise
+
+
+class SnapshotWriter(object):
+    """
+    Background thread that writes serialized snapshots to disk. Besides the snapshot being written, at most one is
+    kept pending: a newer snapshot for the same file replaces it (only the last one would survive anyway), while one
+    for a different file waits until the pending one is picked up, so that no file is skipped.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self.last_write_time = None
+        self._thread = threading.Thread(target=self._run, name='SnapshotWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, file_name, data):
+        with self._cond:
+            while self._pending is not None and self._pending[0] != file_name:
+                self._cond.wait()
+            self._pending = (file_name, data)
+            self._cond.notify_all()
+
+    def flush(self):
+        with self._cond:
+            while self._pending is not None or self._busy:
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                file_name, data = self._pending
+                self._pending = None
+                self._busy = True
+                self._cond.notify_all()
+            start_time = time.time()
+            try:
+                _write_atomic(file_name, data)
+            except Exception as e:
+                print(colorize("Could not write snapshot %s: %s" % (file_name, e), 'red'), file=sys.stderr)
+            with self._cond:
+                self.last_write_time = time.time() - start_time
+                self._busy = False
+                self._cond.notify_all()
+
+
+# id of each Parameterized object that has been snapshotted -> (weak reference to it, its pickled Serializable state)
+_param_skeletons = dict()
+
+
+def _is_plain_parameterized(t):
+    from rllab.core.parameterized import Parameterized
+    return issubclass(t, Parameterized) and t.__getstate__ is Parameterized.__getstate__
+
+
+class _SnapshotDispatchTable(object):
+    """
+    Dispatch table of the snapshot pickler. Parameterized objects are pickled as their Serializable state, which is
+    fixed at construction and thus serialized only once per object, plus their current parameter values.
+    """
+
+    def __init__(self, base):
+        self._base = base
+
+    def __getitem__(self, t):
+        if _is_plain_parameterized(t):
+            return _reduce_parameterized
+        return self._base[t]
+
+    def get(self, t, default=None):
+        try:
+            return self[t]
+        except KeyError:
+            return default
+
+
+_snapshot_pickler_cls = None
+
+
+def _get_snapshot_pickler_cls():
+    global _snapshot_pickler_cls
+    if _snapshot_pickler_cls is None:
+        import cloudpickle
+
+        class SnapshotPickler(cloudpickle.CloudPickler):
+            # the dispatch table is used by the pure python picklers, reducer_override by the C one (python >= 3.8)
+            dispatch_table = _SnapshotDispatchTable(getattr(cloudpickle.CloudPickler, 'dispatch_table',
+                                                            copyreg.dispatch_table))
+
+            def reducer_override(self, obj):
+                if _is_plain_parameterized(type(obj)):
+                    return _reduce_parameterized(obj)
+                reducer_override = getattr(super(SnapshotPickler, self), 'reducer_override', None)
+                if reducer_override is None:
+                    return NotImplemented
+                return reducer_override(obj)
+
+        _snapshot_pickler_cls = SnapshotPickler
+    return _snapshot_pickler_cls
+
+
+def _reduce_parameterized(obj):
+    import cloudpickle
+    from rllab.core.serializable import Serializable
+    ref, skeleton = _param_skeletons.get(id(obj), (None, None))
+    if ref is None or ref() is not obj:
+        skeleton = cloudpickle.dumps(Serializable.__getstate__(obj), protocol=3)
+        _param_skeletons[id(obj)] = (weakref.ref(obj), skeleton)
+    return _restore_parameterized, (type(obj), skeleton, obj.get_param_values())
+
+
+def _restore_parameterized(cls, skeleton, param_values):
+    # same as unpickling the object with its default state: Serializable state plus "params"
+    obj = cls.__new__(cls)
+    obj.__setstate__(dict(pickle.loads(skeleton), params=param_values))
+    return obj
+
+
+def _dumps_snapshot(params):
+    f = io.BytesIO()
+    _get_snapshot_pickler_cls()(f, protocol=3).dump(params)
+    return f.getvalue()
+
+
 def log_parameters(log_file, args, classes):
     log_params = {}
     for param_name, param_value in args.__dict__.items():
@@ -20,6 +20,37 @@ def register_license(file_path):
     return result
 
 
+class MjArrayViews(object):
+    """
+    Read-only numpy views over the array fields of a wrapped mujoco struct (e.g. `model.data.views.qpos`). The
+    properties of the wrappers copy the buffer element by element on every access; these views share its memory
+    instead, and are built once per field. They always reflect the current content of the buffer, so copy them if the
+    value has to be kept across simulation steps.
+    """
+
+    def __init__(self, wrapper):
+        self._wrapper = wrapper
+        self._views = dict()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        views = self._views
+        if name not in views:
+            # read the field once through the wrapper to get its shape
+            value = getattr(self._wrapper, name)
+            if not isinstance(value, np.ndarray):
+                raise AttributeError("%s is not an array field" % name)
+            if value.size == 0:
+                view = np.zeros(value.shape, dtype=value.dtype)
+            else:
+                view = np.ctypeslib.as_array(getattr(self._wrapper.obj, name), shape=value.shape)
+                view = view.reshape(value.shape)
+            view.setflags(write=False)
+            views[name] = view
+        return views[name]
+
+
 class dict2(dict):
     def __init__(self, **kwargs):
         dict.__init__(self, kwargs)
@@ -42,6 +73,7 @@ class MjModel(MjModelWrapper):
         sizes = dict2(**{ k: getattr(self, k) for k in fields })
         data = MjData(data_ptr, sizes)
         self.data = data
+        self.views = MjArrayViews(self)
         self._body_comvels = None
         self.forward()
 
@@ -148,6 +180,7 @@ class MjData(MjDataWrapper):
 
     def __init__(self, wrapped, size_src=None):
         super(MjData, self).__init__(wrapped, size_src)
+        self.views = MjArrayViews(self)
 
     def __del__(self):
         if self._wrapped is not None:
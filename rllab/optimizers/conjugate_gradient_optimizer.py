@@ -12,23 +12,33 @@ from _ast import Num
 
 class PerlmutterHvp(Serializable):
 
-    def __init__(self, num_slices=1):
+    def __init__(self, num_slices=1, memory_budget=None):
         Serializable.quick_init(self, locals())
         self.target = None
         self.reg_coeff = None
         self.opt_fun = None
         self._num_slices = num_slices
+        self._memory_budget = memory_budget
+        self._slices = num_slices
 
     def update_opt(self, f, target, inputs, reg_coeff):
         self.target = target
         self.reg_coeff = reg_coeff
+        self._slices = ext.resolve_slices(self._num_slices, target, self._memory_budget)
         params = target.get_params(trainable=True)
 
         constraint_grads = theano.grad(
             f, wrt=params, disconnected_inputs='warn')
         xs = tuple([ext.new_tensor_like("%s x" % p.name, p) for p in params])
-
-        def Hx_plain():
+        flat_x = ext.new_tensor("flat x", 1, params[0].dtype)
+        # the inputs of the pinned function are fed once per optimization from these shared variables
+        self._pinned_inputs = [
+            theano.shared(np.zeros((1,) * v.ndim, dtype=v.dtype), name="pinned %s" % v.name,
+                          broadcastable=v.broadcastable)
+            for v in inputs
+        ]
+
+        def Hx_plain(xs):
             Hx_plain_splits = TT.grad(
                 TT.sum([TT.sum(g * x)
                         for g, x in zip(constraint_grads, xs)]),
@@ -37,36 +47,69 @@ class PerlmutterHvp(Serializable):
             )
             return TT.concatenate([TT.flatten(s) for s in Hx_plain_splits])
 
+        def Hx_pinned():
+            flat_xs = ext.unflatten_tensor_variables(flat_x, target.get_param_shapes(trainable=True), params)
+            return Hx_plain(flat_xs) + reg_coeff * flat_x
+
         self.opt_fun = ext.lazydict(
             f_Hx_plain=lambda: ext.compile_function(
                 inputs=inputs + xs,
-                outputs=Hx_plain(),
+                outputs=Hx_plain(xs),
                 log_name="f_Hx_plain",
             ),
+            f_Hx_pinned=lambda: ext.compile_function(
+                inputs=[flat_x],
+                outputs=Hx_pinned(),
+                givens=list(zip(inputs, self._pinned_inputs)),
+                log_name="f_Hx_pinned",
+            ),
         )
 
     def build_eval(self, inputs):
         def eval(x):
             xs = tuple(self.target.flat_to_params(x, trainable=True))
-            ret = sliced_fun(self.opt_fun["f_Hx_plain"], self._num_slices)(
+            ret = sliced_fun(self.opt_fun["f_Hx_plain"], self._slices)(
                 inputs, xs) + self.reg_coeff * x
             return ret
 
         return eval
 
+    def build_pinned_eval(self, inputs):
+        """
+        Same as build_eval, but the inputs are copied once into shared variables and every evaluation is a single call
+        of a function of the flat vector x alone, with the regularization included. The inputs are not sliced, so
+        they have to fit in memory at once.
+        """
+        for pinned, value in zip(self._pinned_inputs, inputs):
+            pinned.set_value(np.asarray(value, dtype=pinned.dtype), borrow=True)
+        f_Hx_pinned = self.opt_fun["f_Hx_pinned"]
+        dtype = self.target.get_param_dtypes(trainable=True)[0]
+
+        def eval(x):
+            return f_Hx_pinned(np.asarray(x, dtype=dtype))
+
+        return eval
+
+    def release_pinned_inputs(self):
+        for pinned in self._pinned_inputs:
+            pinned.set_value(np.zeros((1,) * pinned.ndim, dtype=pinned.dtype), borrow=True)
+
 
 class FiniteDifferenceHvp(Serializable):
 
-    def __init__(self, base_eps=1e-5, symmetric=True, grad_clip=None, num_slices=1):
+    def __init__(self, base_eps=1e-5, symmetric=True, grad_clip=None, num_slices=1, memory_budget=None):
         Serializable.quick_init(self, locals())
         self.base_eps = base_eps
         self.symmetric = symmetric
         self.grad_clip = grad_clip
         self._num_slices = num_slices
+        self._memory_budget = memory_budget
+        self._slices = num_slices
 
     def update_opt(self, f, target, inputs, reg_coeff):
         self.target = target
         self.reg_coeff = reg_coeff
+        self._slices = ext.resolve_slices(self._num_slices, target, self._memory_budget)
 
         params = target.get_params(trainable=True)
 
@@ -107,7 +150,7 @@ class FiniteDifferenceHvp(Serializable):
     def build_eval(self, inputs):
         def eval(x):
             xs = tuple(self.target.flat_to_params(x, trainable=True))
-            ret = sliced_fun(self.opt_fun["f_Hx_plain"], self._num_slices)(
+            ret = sliced_fun(self.opt_fun["f_Hx_plain"], self._slices)(
                 inputs, xs) + self.reg_coeff * x
             return ret
 
@@ -130,7 +173,10 @@ class ConjugateGradientOptimizer(Serializable):
             max_backtracks=15,
             accept_violation=False,
             hvp_approach=None,
-            num_slices=1):
+            num_slices=1,
+            memory_budget=None,
+            pin_hvp_inputs=False,
+            backtrack_batch_size=1):
         """
 
         :param cg_iters: The number of CG iterations used to calculate A^-1 g
@@ -139,6 +185,15 @@ class ConjugateGradientOptimizer(Serializable):
         computation time for the descent direction dominates, this can greatly reduce the overall computation time.
         :param accept_violation: whether to accept the descent step if it violates the line search condition after
         exhausting all backtracking budgets
+        :param num_slices: number of slices in which the inputs are split when evaluating the functions, or 'auto' to
+        pick the slice size from memory_budget and the activations of the target
+        :param memory_budget: bytes available for evaluating one slice with num_slices='auto',
+        config.SLICE_MEMORY_BUDGET by default
+        :param pin_hvp_inputs: whether to copy the (subsampled) inputs of the Hessian-vector products once per
+        optimization into shared variables, so that each CG iteration is a single unsliced call taking only the
+        direction. Only used by hvp approaches implementing build_pinned_eval.
+        :param backtrack_batch_size: number of backtracking step ratios whose loss and constraint are evaluated in a
+        single call. The first acceptable ratio is kept, as when they are tried one at a time.
         :return:
         """
         Serializable.quick_init(self, locals())
@@ -148,6 +203,10 @@ class ConjugateGradientOptimizer(Serializable):
         self._backtrack_ratio = backtrack_ratio
         self._max_backtracks = max_backtracks
         self._num_slices = num_slices
+        self._memory_budget = memory_budget
+        self._slices = num_slices
+        self._pin_hvp_inputs = pin_hvp_inputs
+        self._backtrack_batch_size = backtrack_batch_size
 
         self._opt_fun = None
         self._target = None
@@ -155,7 +214,7 @@ class ConjugateGradientOptimizer(Serializable):
         self._constraint_name = None
         self._accept_violation = accept_violation
         if hvp_approach is None:
-            hvp_approach = PerlmutterHvp(num_slices)
+            hvp_approach = PerlmutterHvp(num_slices, memory_budget)
         self._hvp_approach = hvp_approach
 
     def update_opt(self, loss, target, leq_constraint, inputs, extra_inputs=None, constraint_name="constraint", *args,
@@ -179,6 +238,7 @@ class ConjugateGradientOptimizer(Serializable):
 
         constraint_term, constraint_value = leq_constraint
 
+        self._slices = ext.resolve_slices(self._num_slices, target, self._memory_budget)
         params = target.get_params(trainable=True)
         grads = theano.grad(loss, wrt=params, disconnected_inputs='warn')
         flat_grad = ext.flatten_tensor_variables(grads)
@@ -186,6 +246,22 @@ class ConjugateGradientOptimizer(Serializable):
         self._hvp_approach.update_opt(f=constraint_term, target=target, inputs=inputs + extra_inputs,
                                       reg_coeff=self._reg_coeff)
 
+        # loss and constraint after taking the steps prev_param - ratio * flat_step, for a batch of ratios
+        flat_step = ext.new_tensor("flat step", 1, params[0].dtype)
+        ratios = ext.new_tensor("ratios", 1, params[0].dtype)
+        step_splits = ext.unflatten_tensor_variables(flat_step, target.get_param_shapes(trainable=True), params)
+
+        def candidates_loss_constraint():
+            candidate_losses, candidate_constraints = [], []
+            for k in range(self._backtrack_batch_size):
+                candidate_loss, candidate_constraint = theano.clone(
+                    [loss, constraint_term],
+                    replace=[(p, p - ratios[k] * s) for p, s in zip(params, step_splits)]
+                )
+                candidate_losses.append(candidate_loss)
+                candidate_constraints.append(candidate_constraint)
+            return [TT.stack(candidate_losses), TT.stack(candidate_constraints)]
+
         self._target = target
         self._max_constraint_val = constraint_value
         self._constraint_name = constraint_name
@@ -211,19 +287,24 @@ class ConjugateGradientOptimizer(Serializable):
                 outputs=[loss, constraint_term],
                 log_name="f_loss_constraint",
             ),
+            f_candidates_loss_constraint=lambda: ext.compile_function(
+                inputs=inputs + extra_inputs + (flat_step, ratios),
+                outputs=candidates_loss_constraint(),
+                log_name="f_candidates_loss_constraint",
+            ),
         )
 
     def loss(self, inputs, extra_inputs=None):
         inputs = tuple(inputs)
         if extra_inputs is None:
             extra_inputs = tuple()
-        return sliced_fun(self._opt_fun["f_loss"], self._num_slices)(inputs, extra_inputs)
+        return sliced_fun(self._opt_fun["f_loss"], self._slices)(inputs, extra_inputs)
 
     def constraint_val(self, inputs, extra_inputs=None):
         inputs = tuple(inputs)
         if extra_inputs is None:
             extra_inputs = tuple()
-        return sliced_fun(self._opt_fun["f_constraint"], self._num_slices)(inputs, extra_inputs)
+        return sliced_fun(self._opt_fun["f_constraint"], self._slices)(inputs, extra_inputs)
 
     def optimize(self, inputs, extra_inputs=None, subsample_grouped_inputs=None):
 
@@ -244,15 +325,19 @@ class ConjugateGradientOptimizer(Serializable):
             subsample_inputs = inputs
 
         logger.log("computing loss before")
-        loss_before = sliced_fun(self._opt_fun["f_loss"], self._num_slices)(
+        loss_before = sliced_fun(self._opt_fun["f_loss"], self._slices)(
             inputs, extra_inputs)
         logger.log("performing update")
         logger.log("computing descent direction")
 
-        flat_g = sliced_fun(self._opt_fun["f_grad"], self._num_slices)(
+        flat_g = sliced_fun(self._opt_fun["f_grad"], self._slices)(
             inputs, extra_inputs)
 
-        Hx = self._hvp_approach.build_eval(subsample_inputs + extra_inputs)
+        pin_hvp_inputs = self._pin_hvp_inputs and hasattr(self._hvp_approach, "build_pinned_eval")
+        if pin_hvp_inputs:
+            Hx = self._hvp_approach.build_pinned_eval(subsample_inputs + extra_inputs)
+        else:
+            Hx = self._hvp_approach.build_eval(subsample_inputs + extra_inputs)
 
         descent_direction = krylov.cg(Hx, flat_g, cg_iters=self._cg_iters)
 
@@ -263,19 +348,25 @@ class ConjugateGradientOptimizer(Serializable):
         if np.isnan(initial_step_size):
             initial_step_size = 1.
         flat_descent_step = initial_step_size * descent_direction
+        if pin_hvp_inputs:
+            self._hvp_approach.release_pinned_inputs()
 
         logger.log("descent direction computed")
 
         prev_param = np.copy(self._target.get_param_values(trainable=True))
-        n_iter = 0
-        for n_iter, ratio in enumerate(self._backtrack_ratio ** np.arange(self._max_backtracks)):
-            cur_step = ratio * flat_descent_step
-            cur_param = prev_param - cur_step
-            self._target.set_param_values(cur_param, trainable=True)
-            loss, constraint_val = sliced_fun(
-                self._opt_fun["f_loss_constraint"], self._num_slices)(inputs, extra_inputs)
-            if loss < loss_before and constraint_val <= self._max_constraint_val:
-                break
+        if self._backtrack_batch_size > 1:
+            n_iter, loss, constraint_val = self._batched_backtrack(
+                inputs, extra_inputs, prev_param, flat_descent_step, loss_before)
+        else:
+            n_iter = 0
+            for n_iter, ratio in enumerate(self._backtrack_ratio ** np.arange(self._max_backtracks)):
+                cur_step = ratio * flat_descent_step
+                cur_param = prev_param - cur_step
+                self._target.set_param_values(cur_param, trainable=True)
+                loss, constraint_val = sliced_fun(
+                    self._opt_fun["f_loss_constraint"], self._slices)(inputs, extra_inputs)
+                if loss < loss_before and constraint_val <= self._max_constraint_val:
+                    break
         if (np.isnan(loss) or np.isnan(constraint_val) or loss >= loss_before or constraint_val >=
                 self._max_constraint_val) and not self._accept_violation:
             logger.log("Line search condition violated. Rejecting the step!")
@@ -293,3 +384,27 @@ class ConjugateGradientOptimizer(Serializable):
         logger.log("backtrack iters: %d" % n_iter)
         logger.log("computing loss after")
         logger.log("optimization finished")
+
+    def _batched_backtrack(self, inputs, extra_inputs, prev_param, flat_descent_step, loss_before):
+        """
+        Evaluate the backtracking step ratios backtrack_batch_size at a time, and set the parameters to the first
+        acceptable one, or to the last one if none is.
+        :return: the index of the chosen ratio, and the loss and constraint value after taking it
+        """
+        f_candidates = sliced_fun(self._opt_fun["f_candidates_loss_constraint"], self._slices)
+        dtype = self._target.get_param_dtypes(trainable=True)[0]
+        flat_descent_step = np.asarray(flat_descent_step, dtype=dtype)
+        all_ratios = (self._backtrack_ratio ** np.arange(self._max_backtracks)).astype(dtype)
+        n_iter, loss, constraint_val = 0, np.nan, np.nan
+        for start in range(0, len(all_ratios), self._backtrack_batch_size):
+            ratios = all_ratios[start:start + self._backtrack_batch_size]
+            padded_ratios = np.concatenate([ratios, np.repeat(ratios[-1], self._backtrack_batch_size - len(ratios))])
+            losses, constraint_vals = f_candidates(inputs, extra_inputs + (flat_descent_step, padded_ratios))
+            losses, constraint_vals = losses[:len(ratios)], constraint_vals[:len(ratios)]
+            accepted = np.flatnonzero((losses < loss_before) & (constraint_vals <= self._max_constraint_val))
+            k = accepted[0] if len(accepted) > 0 else len(ratios) - 1
+            n_iter, loss, constraint_val = start + k, losses[k], constraint_vals[k]
+            if len(accepted) > 0:
+                break
+        self._target.set_param_values(prev_param - all_ratios[n_iter] * flat_descent_step, trainable=True)
+        return n_iter, loss, constraint_val
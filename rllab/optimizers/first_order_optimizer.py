@@ -27,6 +27,7 @@ class FirstOrderOptimizer(Serializable):
             callback=None,
             verbose=False,
             n_slices=1,
+            memory_budget=None,
             **kwargs):
         """
 
@@ -34,7 +35,10 @@ class FirstOrderOptimizer(Serializable):
         :param tolerance:
         :param update_method:
         :param batch_size: None or an integer. If None the whole dataset will be used.
-        :param n_slices: Slice evaluation functions where possible into n_slices.
+        :param n_slices: Slice evaluation functions where possible into n_slices, or 'auto' to pick the slice size
+        from memory_budget and the activations of the target.
+        :param memory_budget: bytes available for evaluating one slice with n_slices='auto',
+        config.SLICE_MEMORY_BUDGET by default
         :param callback:
         :param kwargs:
         :return:
@@ -50,6 +54,8 @@ class FirstOrderOptimizer(Serializable):
         self._batch_size = batch_size
         self._verbose = verbose
         self._n_slices = n_slices
+        self._memory_budget = memory_budget
+        self._slices = n_slices
 
     def update_opt(self, loss, target, inputs, extra_inputs=None, gradients=None, **kwargs):
         """
@@ -61,6 +67,7 @@ class FirstOrderOptimizer(Serializable):
         """
 
         self._target = target
+        self._slices = ext.resolve_slices(self._n_slices, target, self._memory_budget)
 
         if gradients is None:
             gradients = theano.grad(loss, target.get_params(trainable=True), disconnected_inputs='ignore')
@@ -82,7 +89,7 @@ class FirstOrderOptimizer(Serializable):
     def loss(self, inputs, extra_inputs=None):
         if extra_inputs is None:
             extra_inputs = tuple()
-        return sliced_fun(self._opt_fun["f_loss"], self._n_slices)(inputs, extra_inputs)
+        return sliced_fun(self._opt_fun["f_loss"], self._slices)(inputs, extra_inputs)
 
     def optimize_gen(self, inputs, extra_inputs=None, callback=None, yield_itr=None):
 
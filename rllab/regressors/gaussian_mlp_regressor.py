@@ -17,6 +17,29 @@ from rllab.distributions.diagonal_gaussian import DiagonalGaussian
 from rllab.misc.ext import iterate_minibatches_generic
 
 
+def merge_moments(moments, data, max_count=None):
+    """
+    Merge the mean and variance of data along its first axis into the running moments (count, mean, var).
+    :param moments: previous (count, mean, var), or None
+    :param data: array of new samples
+    :param max_count: if given, the weight of the previous moments is capped so that at most max_count samples count
+    :return: the merged (count, mean, var), mean and var keeping the first axis with size 1
+    """
+    count = len(data)
+    mean = np.mean(data, axis=0, keepdims=True)
+    var = np.var(data, axis=0, keepdims=True)
+    if moments is not None:
+        old_count, old_mean, old_var = moments
+        if max_count is not None:
+            old_count = min(old_count, max(max_count - count, 0))
+        total = old_count + count
+        delta = mean - old_mean
+        mean = old_mean + delta * count / total
+        var = (old_var * old_count + var * count + np.square(delta) * old_count * count / total) / total
+        count = total
+    return count, mean, var
+
+
 class GaussianMLPRegressor(LasagnePowered, Serializable):
     """
     A class for performing regression by fitting a Gaussian distribution to the outputs.
@@ -43,6 +66,10 @@ class GaussianMLPRegressor(LasagnePowered, Serializable):
             name=None,
             batchsize=None,
             subsample_factor=1.,
+            incremental=False,
+            validation_split=0.1,
+            max_epochs=5,
+            patience=1,
     ):
         """
         :param input_shape: Shape of the input data.
@@ -60,11 +87,24 @@ class GaussianMLPRegressor(LasagnePowered, Serializable):
         `std_share_network` is False. It defaults to the same architecture as the mean.
         :param std_nonlinearity: Non-linearity used for each layer of the std network. Only used if `std_share_network`
         is False. It defaults to the same non-linearity as the mean.
+        :param incremental: Whether fit warm-starts from the current parameters with fixed normalization constants,
+        which are only changed through update_normalization, and stops early on a validation loss.
+        :param validation_split: Fraction of the samples held out to compute the validation loss. Only used if
+        `incremental` is True.
+        :param max_epochs: Maximum number of passes over the training samples. Only used if `incremental` is True.
+        :param patience: Number of epochs without improvement of the validation loss before stopping. Only used if
+        `incremental` is True.
         """
         Serializable.quick_init(self, locals())
 
         self._batchsize = batchsize
         self._subsample_factor = subsample_factor
+        self._incremental = incremental
+        self._validation_split = validation_split
+        self._max_epochs = max_epochs
+        self._patience = patience
+        self._x_moments = None
+        self._y_moments = None
 
         self.input_shape = input_shape
         self.output_dim = output_dim
@@ -194,7 +234,23 @@ class GaussianMLPRegressor(LasagnePowered, Serializable):
         self._y_mean_var = y_mean_var
         self._y_std_var = y_std_var
 
+    def update_normalization(self, xs, ys, max_count=None):
+        """
+        Merge the moments of xs and ys into the running normalization constants.
+        :param max_count: maximum number of samples accounted for by the constants, see merge_moments
+        """
+        if self._normalize_inputs:
+            self._x_moments = merge_moments(self._x_moments, xs, max_count)
+            self._x_mean_var.set_value(self._x_moments[1].astype(theano.config.floatX))
+            self._x_std_var.set_value((np.sqrt(self._x_moments[2]) + 1e-8).astype(theano.config.floatX))
+        if self._normalize_outputs:
+            self._y_moments = merge_moments(self._y_moments, ys, max_count)
+            self._y_mean_var.set_value(self._y_moments[1].astype(theano.config.floatX))
+            self._y_std_var.set_value((np.sqrt(self._y_moments[2]) + 1e-8).astype(theano.config.floatX))
+
     def fit(self, xs, ys):
+        if self._incremental:
+            return self._fit_incremental(xs, ys)
 
         if self._normalize_inputs:
             # recompute normalizing constants for inputs
@@ -235,6 +291,54 @@ class GaussianMLPRegressor(LasagnePowered, Serializable):
         if self._use_trust_region:
             logger.record_tabular(prefix + 'MeanKL', mean_kl / batch_count)
 
+    def _fit_incremental(self, xs, ys):
+        if self._name:
+            prefix = self._name + "_"
+        else:
+            prefix = ""
+        if self._use_trust_region:
+            # the trust region is around the parameters at the start of the fit, so the old distributions are computed
+            # once for all the samples
+            old_means, old_log_stds = self._f_pdists(xs)
+            data = [xs, ys, old_means, old_log_stds]
+        else:
+            data = [xs, ys]
+        n_val = int(len(xs) * self._validation_split)
+        if n_val > 0:
+            indices = np.random.permutation(len(xs))
+            val_data = [d[indices[:n_val]] for d in data]
+            train_data = [d[indices[n_val:]] for d in data]
+        else:
+            val_data = train_data = data
+
+        loss_before = self._optimizer.loss(train_data)
+        best_val_loss = self._optimizer.loss(val_data)
+        val_loss_before = best_val_loss
+        best_params = self.get_param_values(trainable=True)
+        n_epochs, n_bad_epochs = 0, 0
+        while n_epochs < self._max_epochs and n_bad_epochs < self._patience:
+            n_epochs += 1
+            for batch in iterate_minibatches_generic(input_lst=train_data, batchsize=self._batchsize, shuffle=True):
+                self._optimizer.optimize(batch)
+            val_loss = self._optimizer.loss(val_data)
+            if val_loss < best_val_loss:
+                best_val_loss = val_loss
+                best_params = self.get_param_values(trainable=True)
+                n_bad_epochs = 0
+            else:
+                n_bad_epochs += 1
+        self.set_param_values(best_params, trainable=True)
+        loss_after = self._optimizer.loss(train_data)
+
+        logger.record_tabular(prefix + 'LossBefore', loss_before)
+        logger.record_tabular(prefix + 'LossAfter', loss_after)
+        logger.record_tabular(prefix + 'dLoss', loss_before - loss_after)
+        logger.record_tabular(prefix + 'ValLossBefore', val_loss_before)
+        logger.record_tabular(prefix + 'ValLossAfter', best_val_loss)
+        logger.record_tabular(prefix + 'FitEpochs', n_epochs)
+        if self._use_trust_region:
+            logger.record_tabular(prefix + 'MeanKL', self._optimizer.constraint_val(train_data))
+
     def predict(self, xs):
         """
         Return the maximum likelihood estimate of the predicted y.
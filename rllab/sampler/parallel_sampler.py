@@ -74,6 +74,35 @@ def populate_task(env, policy, scope=None):
     logger.log("Populated")
 
 
+def _worker_call_env_method(G, method_name, args, kwargs, scope=None):
+    G = _get_scoped_G(G, scope)
+    # also update the clones kept by the vectorized sampler, if any
+    if getattr(G, "vec_envs_source", None) is G.env:
+        envs = G.vec_envs
+    else:
+        envs = [G.env]
+    if singleton_pool.n_parallel == 1:
+        # the populated env is the one of the master process, already updated by the caller
+        envs = envs[1:]
+    args, kwargs = pickle.loads(args), pickle.loads(kwargs)
+    for env in envs:
+        getattr(env, method_name)(*args, **kwargs)
+
+
+def call_env_method(method_name, *args, scope=None, **kwargs):
+    """
+    Call a method of the env populated in each worker, e.g. update_start_generator, so that the workers can be kept
+    populated while the env of the master process is modified. The caller is responsible for calling it on its own env.
+    """
+    if scope not in _cached_populate_env:
+        # nothing populated yet: the next populate_task will ship the updated env
+        return
+    singleton_pool.run_each(
+        _worker_call_env_method,
+        [(method_name, pickle.dumps(args), pickle.dumps(kwargs), scope)] * singleton_pool.n_parallel
+    )
+
+
 def terminate_task(scope=None):
     singleton_pool.run_each(
         _worker_terminate_task,
@@ -103,6 +132,10 @@ def _worker_set_policy_params(G, params, scope=None):
 def _worker_set_env_params(G, params, scope=None):
     G = _get_scoped_G(G, scope)
     G.env.set_param_values(params)
+    # also update the clones kept by the vectorized sampler, if any
+    if getattr(G, "vec_envs_source", None) is G.env:
+        for env in G.vec_envs[1:]:
+            env.set_param_values(params)
 
 
 def _worker_collect_one_path(G, max_path_length, scope=None):
@@ -3,7 +3,85 @@ from rllab.misc import tensor_utils
 import time
 
 
-def rollout(env, agent, max_path_length=np.inf, animated=False, speedup=1, init_state=None, no_action = False):
+class PathBuffer(object):
+    """
+    Preallocated arrays holding a single path. The shapes and dtypes of the agent and env infos are learned from the
+    first appended step. If max_path_length is infinite the arrays start small and double their size when full.
+    """
+
+    def __init__(self, max_path_length=np.inf, initial_size=128):
+        if np.isinf(max_path_length):
+            self.capacity = initial_size
+        else:
+            self.capacity = int(max_path_length)
+        self.length = 0
+        self.arrays = None
+
+    @staticmethod
+    def _allocate(example, capacity):
+        if isinstance(example, dict):
+            return {k: PathBuffer._allocate(v, capacity) for k, v in example.items()}
+        example = np.asarray(example)
+        if example.dtype.kind in 'OUS':
+            dtype = object
+        elif example.dtype.kind in 'iu':
+            # an env may return an int first (e.g. a reward of 0) and floats later, which must not be truncated
+            dtype = np.float64
+        else:
+            dtype = example.dtype
+        return np.empty((capacity,) + example.shape, dtype=dtype)
+
+    @staticmethod
+    def _write(arrays, idx, values):
+        for k, v in values.items():
+            if isinstance(arrays[k], dict):
+                PathBuffer._write(arrays[k], idx, v)
+            else:
+                arrays[k][idx] = v
+
+    @staticmethod
+    def _resize(arrays, capacity):
+        if isinstance(arrays, dict):
+            return {k: PathBuffer._resize(v, capacity) for k, v in arrays.items()}
+        new_array = np.empty((capacity,) + arrays.shape[1:], dtype=arrays.dtype)
+        new_array[:len(arrays)] = arrays
+        return new_array
+
+    @staticmethod
+    def _trim(arrays, length):
+        if isinstance(arrays, dict):
+            return {k: PathBuffer._trim(v, length) for k, v in arrays.items()}
+        return arrays[:length]
+
+    def append(self, observation, action, reward, agent_info, env_info, done):
+        step = dict(observations=observation, actions=action, rewards=reward, agent_infos=agent_info,
+                    env_infos=env_info, dones=done)
+        if self.arrays is None:
+            self.arrays = self._allocate(step, self.capacity)
+        elif self.length == self.capacity:
+            self.capacity *= 2
+            self.arrays = self._resize(self.arrays, self.capacity)
+        self._write(self.arrays, self.length, step)
+        self.length += 1
+
+    def get_path(self, last_obs):
+        """ Return the path dict, holding views of the buffers trimmed to the path length. """
+        if self.arrays is None:
+            path = dict(observations=np.zeros((0,)), actions=np.zeros((0,)), rewards=np.zeros((0,)), agent_infos={},
+                        env_infos={}, dones=np.zeros((0,), dtype=bool))
+        else:
+            path = self._trim(self.arrays, self.length)
+        path["last_obs"] = last_obs
+        return path
+
+
+def rollout(env, agent, max_path_length=np.inf, animated=False, speedup=1, init_state=None, no_action = False,
+            preallocate=False):
+    """
+    :param preallocate: write the path into a PathBuffer instead of growing python lists of arrays and dicts
+    """
+    if preallocate:
+        path_buffer = PathBuffer(max_path_length)
     observations = []
     actions = []
     rewards = []
@@ -24,12 +102,16 @@ def rollout(env, agent, max_path_length=np.inf, animated=False, speedup=1, init_
         if no_action:
             a = np.zeros_like(a)
         next_o, r, d, env_info = env.step(a)
-        observations.append(env.observation_space.flatten(o))
-        rewards.append(r)
-        actions.append(env.action_space.flatten(a))
-        agent_infos.append(agent_info)
-        env_infos.append(env_info)
-        dones.append(d)
+        if preallocate:
+            path_buffer.append(env.observation_space.flatten(o), env.action_space.flatten(a), r, agent_info,
+                               env_info, d)
+        else:
+            observations.append(env.observation_space.flatten(o))
+            rewards.append(r)
+            actions.append(env.action_space.flatten(a))
+            agent_infos.append(agent_info)
+            env_infos.append(env_info)
+            dones.append(d)
         path_length += 1
         if d:
             break
@@ -41,6 +123,8 @@ def rollout(env, agent, max_path_length=np.inf, animated=False, speedup=1, init_
     if animated:
         env.render(close=False)
 
+    if preallocate:
+        return path_buffer.get_path(last_obs=o)
     return dict(
         observations=tensor_utils.stack_tensor_list(observations),
         actions=tensor_utils.stack_tensor_list(actions),
@@ -0,0 +1,244 @@
+import hashlib
+
+import cloudpickle as pickle
+import numpy as np
+
+from rllab.sampler import parallel_sampler
+from rllab.sampler.base import BaseSampler
+from rllab.sampler.parallel_sampler import _get_scoped_G
+from rllab.sampler.stateful_pool import singleton_pool
+from rllab.sampler.utils import PathBuffer
+
+
+def vectorized_rollouts(envs, agent, max_path_length=np.inf, init_states=None):
+    """
+    Roll out one episode in each of the given envs, stepping all of them in lockstep. The actions of all the envs
+    that are still running are computed with a single call to agent.get_actions.
+    :param envs: list of environments, usually clones of the same one
+    :param agent: policy implementing get_actions (non-recurrent)
+    :param max_path_length: horizon of the episodes, or a list with the horizon of each env
+    :param init_states: optional list with the init_state to reset each env to
+    :return: a list with one path per env, with the same keys as the ones returned by rollout
+    """
+    n_envs = len(envs)
+    if init_states is not None:
+        obses = [env.reset(init_state=init_state) for env, init_state in zip(envs, init_states)]
+    else:
+        obses = [env.reset() for env in envs]
+    agent.reset()
+    max_path_lengths = np.broadcast_to(max_path_length, (n_envs,))
+    path_buffers = [PathBuffer(horizon) for horizon in max_path_lengths]
+    live = [i for i in range(n_envs) if max_path_lengths[i] > 0]
+    path_length = 0
+    while len(live) > 0:
+        actions, agent_infos = agent.get_actions([obses[i] for i in live])
+        still_live = []
+        for j, i in enumerate(live):
+            env = envs[i]
+            next_o, r, d, env_info = env.step(actions[j])
+            path_buffers[i].append(env.observation_space.flatten(obses[i]), env.action_space.flatten(actions[j]), r,
+                                   {k: v[j] for k, v in agent_infos.items()}, env_info, d)
+            if not d:
+                obses[i] = next_o
+                if path_length + 1 < max_path_lengths[i]:
+                    still_live.append(i)
+        live = still_live
+        path_length += 1
+
+    return [path_buffer.get_path(last_obs=obs) for path_buffer, obs in zip(path_buffers, obses)]
+
+
+def batch_env_rollouts(batch_env, agent, max_path_length):
+    """
+    Roll out one episode in each copy of a batched env (see Env.vectorize), stepping all the live copies with a single
+    call to batch_env.step. The transitions are written into preallocated (max_path_length, n_envs, ...) arrays.
+    :param batch_env: batched environment, as returned by env.vectorize(n_envs)
+    :param agent: policy implementing get_actions (non-recurrent)
+    :param max_path_length: horizon of the episodes
+    :return: a list with one path per copy, with the same keys as the ones returned by vectorized_rollouts
+    """
+    n_envs = batch_env.n_envs
+    horizon = int(max_path_length)
+    obses = np.asarray(batch_env.reset(np.arange(n_envs)))
+    agent.reset()
+    buffers = None
+    path_lengths = np.zeros(n_envs, dtype=int)
+    live = np.arange(n_envs)
+    t = 0
+    while len(live) > 0 and t < horizon:
+        actions, agent_infos = agent.get_actions(obses[live])
+        next_obses, rewards, dones, env_infos = batch_env.step(actions, live)
+        dones = np.asarray(dones, dtype=bool)
+        step = dict(observations=obses[live], actions=actions, rewards=rewards, dones=dones,
+                    agent_infos=agent_infos, env_infos=env_infos)
+        if buffers is None:
+            buffers = _allocate_step_buffers(step, horizon, n_envs)
+        _write_step(buffers, step, t, live)
+        path_lengths[live] += 1
+        obses[live[~dones]] = next_obses[~dones]
+        live = live[~dones]
+        t += 1
+
+    if buffers is None:
+        return [dict(observations=obses[i:i], actions=np.zeros((0,)), rewards=np.zeros(0), dones=np.zeros(0, bool),
+                     agent_infos={}, env_infos={}, last_obs=obses[i]) for i in range(n_envs)]
+    paths = []
+    for i, length in enumerate(path_lengths):
+        path = _read_path(buffers, i, length)
+        path["last_obs"] = obses[i]
+        paths.append(path)
+    return paths
+
+
+def _allocate_step_buffers(step, horizon, n_envs):
+    if isinstance(step, dict):
+        return {k: _allocate_step_buffers(v, horizon, n_envs) for k, v in step.items()}
+    step = np.asarray(step)
+    return np.zeros((horizon, n_envs) + step.shape[1:], dtype=step.dtype)
+
+
+def _write_step(buffers, step, t, indices):
+    for k, v in step.items():
+        if isinstance(v, dict):
+            _write_step(buffers[k], v, t, indices)
+        else:
+            buffers[k][t, indices] = v
+
+
+def _read_path(buffers, i, length):
+    return {k: _read_path(v, i, length) if isinstance(v, dict) else v[:length, i] for k, v in buffers.items()}
+
+
+def get_batch_env(G, n_envs):
+    """
+    Return the batched version with n_envs copies of the env populated in G, cached in G until a different env is
+    populated, or None if that env cannot be vectorized.
+    """
+    if getattr(G, "batch_env_source", None) is not G.env or \
+            (G.batch_env is not None and G.batch_env.n_envs != n_envs):
+        try:
+            G.batch_env = G.env.vectorize(n_envs)
+        except NotImplementedError:
+            G.batch_env = None
+        G.batch_env_source = G.env
+    return G.batch_env
+
+
+def env_fingerprint(env):
+    """
+    Digest of the pickled env: the copies of two envs with the same fingerprint are identical.
+    """
+    return hashlib.sha1(pickle.dumps(env)).hexdigest()
+
+
+def get_vec_envs(G, n_envs, key=None):
+    """
+    Return n_envs copies of the env populated in G: the env itself followed by clones of it. The clones are cached in
+    G and rebuilt when a different env is populated, when key differs from the one they were built with (e.g. the
+    env_fingerprint of an env that may have been modified since), or when more copies are needed.
+    """
+    if getattr(G, "vec_envs_source", None) is not G.env or getattr(G, "vec_envs_key", None) != key:
+        for env in getattr(G, "vec_envs", [])[1:]:
+            env.terminate()
+        G.vec_envs = [G.env]
+        G.vec_envs_source = G.env
+        G.vec_envs_key = key
+    if len(G.vec_envs) < n_envs:
+        env_pkl = pickle.dumps(G.env)
+        G.vec_envs.extend(pickle.loads(env_pkl) for _ in range(n_envs - len(G.vec_envs)))
+    return G.vec_envs[:n_envs]
+
+
+def _worker_terminate_vec_envs(G, scope=None):
+    G = _get_scoped_G(G, scope)
+    for env in getattr(G, "vec_envs", [])[1:]:
+        env.terminate()
+    G.vec_envs = []
+    G.vec_envs_source = None
+    G.vec_envs_key = None
+    G.batch_env = None
+    G.batch_env_source = None
+
+
+def _worker_collect_vectorized_paths(G, max_path_length, n_envs, scope=None, env_key=None):
+    G = _get_scoped_G(G, scope)
+    batch_env = get_batch_env(G, n_envs)
+    if batch_env is not None:
+        paths = batch_env_rollouts(batch_env, G.policy, max_path_length)
+    else:
+        paths = vectorized_rollouts(get_vec_envs(G, n_envs, env_key), G.policy, max_path_length)
+    return paths, sum(len(path["rewards"]) for path in paths)
+
+
+def sample_paths(
+        policy_params,
+        max_samples,
+        max_path_length=np.inf,
+        n_envs=1,
+        env_params=None,
+        scope=None):
+    """
+    Same as parallel_sampler.sample_paths, but each worker steps n_envs copies of its env in lockstep.
+    :param n_envs: number of env copies each worker steps with a single policy forward pass
+    :return: a list of collected paths
+    """
+    singleton_pool.run_each(
+        parallel_sampler._worker_set_policy_params,
+        [(policy_params, scope)] * singleton_pool.n_parallel
+    )
+    if env_params is not None:
+        singleton_pool.run_each(
+            parallel_sampler._worker_set_env_params,
+            [(env_params, scope)] * singleton_pool.n_parallel
+        )
+    env_key = None
+    if singleton_pool.n_parallel == 1 and n_envs > 1:
+        # the populated env is the one of the master process, which may have been modified since its clones were made
+        env_key = env_fingerprint(parallel_sampler._cached_populate_env[scope])
+    path_batches = singleton_pool.run_collect(
+        _worker_collect_vectorized_paths,
+        threshold=max_samples,
+        args=(max_path_length, n_envs, scope, env_key),
+        show_prog_bar=True
+    )
+    return [path for paths in path_batches for path in paths]
+
+
+class VectorizedSampler(BaseSampler):
+    """
+    Batch sampler in which every worker keeps n_envs clones of its env and steps them in lockstep, querying the policy
+    once per time step for all the live envs. Envs that implement vectorize are simulated as a single batched env
+    instead of clones. Pass it as sampler_cls of BatchPolopt, with sampler_args=dict(n_envs=K).
+    """
+
+    def __init__(self, algo, n_envs=8):
+        """
+        :type algo: BatchPolopt
+        """
+        self.algo = algo
+        self.n_envs = n_envs
+
+    def start_worker(self):
+        parallel_sampler.populate_task(self.algo.env, self.algo.policy, scope=self.algo.scope)
+
+    def shutdown_worker(self):
+        singleton_pool.run_each(
+            _worker_terminate_vec_envs,
+            [(self.algo.scope,)] * singleton_pool.n_parallel
+        )
+        parallel_sampler.terminate_task(scope=self.algo.scope)
+
+    def obtain_samples(self, itr):
+        cur_params = self.algo.policy.get_param_values()
+        paths = sample_paths(
+            policy_params=cur_params,
+            max_samples=self.algo.batch_size,
+            max_path_length=self.algo.max_path_length,
+            n_envs=self.n_envs,
+            scope=self.algo.scope,
+        )
+        if self.algo.whole_paths:
+            return paths
+        else:
+            paths_truncated = parallel_sampler.truncate_paths(paths, self.algo.batch_size)
+            return paths_truncated
@@ -0,0 +1,37 @@
+import os
+import os.path as osp
+import shutil
+import stat
+import tempfile
+import unittest
+
+from rllab.misc.logger import _write_atomic
+
+
+class TestWriteAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_new_file_follows_umask(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        file_name = osp.join(self.dir, 'params.pkl')
+        _write_atomic(file_name, b'data')
+        with open(file_name, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(stat.S_IMODE(os.stat(file_name).st_mode), 0o666 & ~umask)
+
+    def test_existing_file_keeps_mode(self):
+        file_name = osp.join(self.dir, 'params.pkl')
+        with open(file_name, 'wb') as f:
+            f.write(b'old')
+        os.chmod(file_name, 0o640)
+        _write_atomic(file_name, b'new')
+        with open(file_name, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+        self.assertEqual(stat.S_IMODE(os.stat(file_name).st_mode), 0o640)
+        self.assertEqual(os.listdir(self.dir), ['params.pkl'])
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from rllab.sampler.utils import PathBuffer
+
+
+class TestPathBuffer(unittest.TestCase):
+
+    def test_int_then_float_rewards(self):
+        buffer = PathBuffer()
+        buffer.append(np.zeros(2), np.zeros(1), 0, dict(), dict(), False)
+        buffer.append(np.zeros(2), np.zeros(1), 0.5, dict(), dict(), True)
+        path = buffer.get_path(np.zeros(2))
+        self.assertEqual(path["rewards"].dtype, np.float64)
+        np.testing.assert_array_equal(path["rewards"], [0., 0.5])
+        self.assertEqual(path["dones"].dtype, bool)
+
+    def test_float32_kept(self):
+        buffer = PathBuffer(max_path_length=3)
+        for t in range(3):
+            buffer.append(np.full(2, t, dtype=np.float32), np.zeros(1, dtype=np.float32), np.float32(t),
+                          dict(mean=np.zeros(1, dtype=np.float32)), dict(), False)
+        path = buffer.get_path(np.zeros(2, dtype=np.float32))
+        self.assertEqual(path["observations"].dtype, np.float32)
+        self.assertEqual(path["actions"].dtype, np.float32)
+        self.assertEqual(path["rewards"].dtype, np.float32)
+        self.assertEqual(path["agent_infos"]["mean"].dtype, np.float32)
+        np.testing.assert_array_equal(path["observations"][:, 0], [0, 1, 2])
+
+    def test_grows_past_initial_size(self):
+        buffer = PathBuffer(initial_size=2)
+        for t in range(5):
+            buffer.append(np.array([t]), np.zeros(1), 1., dict(), dict(), t == 4)
+        path = buffer.get_path(np.zeros(1))
+        np.testing.assert_array_equal(path["observations"][:, 0], np.arange(5))
+        self.assertEqual(len(path["rewards"]), 5)
+
+    def test_empty_path(self):
+        path = PathBuffer().get_path(np.zeros(2))
+        self.assertEqual(len(path["rewards"]), 0)
+        self.assertEqual(path["dones"].dtype, bool)
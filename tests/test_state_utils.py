@@ -0,0 +1,36 @@
+import time
+import unittest
+
+import numpy as np
+
+from curriculum.state.utils import filter_close_points
+
+
+def sequential_filter_close_points(points, radius):
+    kept = []
+    keep = np.zeros(len(points), dtype=bool)
+    for i, point in enumerate(points):
+        if all(np.linalg.norm(point - other) > radius for other in kept):
+            kept.append(point)
+            keep[i] = True
+    return keep
+
+
+class TestFilterClosePoints(unittest.TestCase):
+
+    def test_same_as_sequential_filter(self):
+        rng = np.random.RandomState(0)
+        for points, radius in [(rng.uniform(-1, 1, (1000, 2)), 0.1), (rng.randn(700, 3) * 0.3, 0.2)]:
+            np.testing.assert_array_equal(filter_close_points(points, radius),
+                                          sequential_filter_close_points(points, radius))
+
+    def test_dense_cluster(self):
+        points = np.random.RandomState(1).randn(10000, 2) * 0.02
+        start = time.time()
+        keep = filter_close_points(points, 0.1)
+        self.assertLess(time.time() - start, 5.)
+        np.testing.assert_array_equal(keep, sequential_filter_close_points(points, 0.1))
+        self.assertTrue(keep[0])
+
+    def test_empty(self):
+        self.assertEqual(len(filter_close_points(np.zeros((0, 2)), 0.1)), 0)